@@ -0,0 +1,32 @@
+import asyncio
+
+from fastapi import APIRouter, Response, status
+
+from app.core.db_init import ping_database
+from app.core.readiness import readiness
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+DB_PING_TIMEOUT_SECONDS = 2.0
+
+
+@router.get("/live")
+async def live():
+    """Процесс жив и обрабатывает event loop"""
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def ready(response: Response):
+    """Воркер прогрет и может принимать трафик"""
+    if readiness.shutting_down or not readiness.ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "shutting_down" if readiness.shutting_down else "starting"}
+
+    try:
+        await asyncio.wait_for(ping_database(), DB_PING_TIMEOUT_SECONDS)
+    except Exception:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "database_unavailable"}
+
+    return {"status": "ready", "startup_seconds": readiness.startup_seconds}
@@ -1,15 +1,45 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+import asyncio
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, UploadFile, File
+from fastapi.responses import StreamingResponse
+from pydantic import TypeAdapter
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.db import get_db
+from app.core.config import settings
+from app.core.db import get_db, get_read_db, AsyncSessionLocal
+from app.core.metrics import phase
+from app.core.pagination import keyset_paginate, split_page
+from app.core.response_cache import make_etag, response_cache, results_tag, to_json
 from app.services.auth_service import get_current_active_user_dependency
 from app.models.user import User
 from app.models.image import Image
 from app.models.result import Result
-from app.schemas.analysis import AnalysisResponse
+from app.models.job import AnalysisJob, JOB_DONE, JOB_FAILED, JOB_PENDING
+from app.models.summary import StyleSummary
+from app.schemas.analysis import AnalysisResponse, BatchAnalysisResponse, BatchItemResponse
+from app.schemas.job import JobResponse
+from app.schemas.result import ResultResponse, SimilarResult, SimilarResultsResponse
+from app.schemas.summary import StyleSummaryResponse
+from app.services.analysis_service import (
+    analyze_file,
+    build_image,
+    build_result,
+    current_result_condition,
+    find_cached_analysis,
+    remember_analysis,
+)
+from app.services.batch_service import BatchCollector, analyze_batch
+from app.services.export_service import EXPORT_MEDIA_TYPES, export_results
+from app.services.job_service import job_workers
+from app.services.similarity_service import IndexEntry, find_similar, schedule_indexing, schedule_training
+from app.services.storage_service import save_upload
+from app.services.summary_service import add_analyses_to_summary, summary_response
 from datetime import datetime
 
 router = APIRouter(prefix="/analysis", tags=["analysis"])
 
+_result_list_json = TypeAdapter(list[ResultResponse])
+
 
 @router.post("/analyze-image", response_model=AnalysisResponse)
 async def analyze_image(
@@ -24,41 +54,31 @@ async def analyze_image(
             detail="File must be an image"
         )
 
-    # Читаем файл
-    contents = await file.read()
+    # Потоково сохраняем файл на диск по SHA-256 содержимого
+    with phase("upload"):
+        stored = await save_upload(file)
 
-    # Сохраняем информацию об изображении в БД
-    image = Image(
-        user_id=current_user.id,
-        filename=file.filename,
-        content_type=file.content_type,
-        file_size=len(contents),
-        # Здесь можно сохранить файл в хранилище или обработать его
-    )
+    # Такое же изображение уже анализировалось этой версией модели - инференс не нужен
+    analysis_result = await find_cached_analysis(db, stored.sha256, settings.MODEL_VERSION)
+    cached = analysis_result is not None
+
+    if not cached:
+        analysis_result = await analyze_file(stored.path, stored.sha256)
 
+    # Сохраняем изображение и результат анализа одним коммитом
+    image = build_image(current_user.id, stored, file.filename, file.content_type)
     db.add(image)
-    await db.commit()
-    await db.refresh(image)
-
-    # Здесь будет логика анализа изображения ML моделью
-    # Пока заглушка
-    analysis_result = {
-        "style": "casual",
-        "confidence": 0.85,
-        "colors": ["blue", "white", "black"],
-        "recommendations": ["Great for everyday wear", "Matches your skin tone well"]
-    }
-
-    # Сохраняем результат анализа
-    result = Result(
-        image_id=image.id,
-        user_id=current_user.id,
-        analysis_data=analysis_result
-    )
+    await db.flush()
 
+    result = build_result(image, analysis_result, settings.MODEL_VERSION)
     db.add(result)
+    await add_analyses_to_summary(db, current_user.id, [analysis_result])
     await db.commit()
-    await db.refresh(result)
+
+    if not cached:
+        remember_analysis(image.content_hash, settings.MODEL_VERSION, analysis_result)
+    response_cache.invalidate(results_tag(current_user.id))
+    schedule_indexing([IndexEntry(result.id, current_user.id, stored.sha256, stored.path, analysis_result)])
 
     return AnalysisResponse(
         image_id=image.id,
@@ -68,22 +88,275 @@ async def analyze_image(
     )
 
 
-@router.get("/results")
-async def get_analysis_results(
-        skip: int = 0,
-        limit: int = 20,
+@router.post("/analyze-batch", response_model=BatchAnalysisResponse)
+async def analyze_images_batch(
+        files: List[UploadFile] = File(...),
+        db: AsyncSession = Depends(get_db),
+        current_user: User = Depends(get_current_active_user_dependency),
+):
+    """Анализ нескольких изображений (или zip-архива) за один запрос.
+
+    Ошибка одного файла не прерывает пакет: для каждого файла возвращается
+    либо результат, либо текст ошибки.
+    """
+    collector = BatchCollector(settings.BATCH_MAX_ITEMS)
+    try:
+        with phase("upload"):
+            for file in files:
+                await collector.add_upload(file)
+        await analyze_batch(db, current_user.id, collector.items)
+    finally:
+        collector.close()
+
+    analyzed_at = datetime.utcnow()
+    items = []
+    for item in collector.items:
+        response = BatchItemResponse(index=item.index, filename=item.filename, status="error", error=item.error)
+        if item.result_id is not None:
+            response.status = "ok"
+            response.result = AnalysisResponse(
+                image_id=item.image_id,
+                result_id=item.result_id,
+                analysis=item.analysis,
+                analyzed_at=analyzed_at,
+            )
+        items.append(response)
+
+    succeeded = sum(1 for item in items if item.status == "ok")
+    return BatchAnalysisResponse(items=items, succeeded=succeeded, failed=len(items) - succeeded)
+
+
+async def _job_response(db: AsyncSession, job: AnalysisJob) -> JobResponse:
+    response = JobResponse(
+        job_id=job.id,
+        status=job.status,
+        image_id=job.image_id,
+        error=job.error,
+        created_at=job.created_at,
+        updated_at=job.updated_at,
+    )
+    if job.status == JOB_DONE and job.result_id is not None:
+        result = await db.get(Result, job.result_id)
+        response.result = AnalysisResponse(
+            image_id=job.image_id,
+            result_id=result.id,
+            analysis=result.analysis_data,
+            analyzed_at=result.created_at,
+        )
+    return response
+
+
+async def _get_user_job(db: AsyncSession, job_id: int, user_id: int) -> AnalysisJob:
+    job = await db.get(AnalysisJob, job_id, populate_existing=True)
+    if job is None or job.user_id != user_id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Job not found"
+        )
+    return job
+
+
+@router.post("/jobs", response_model=JobResponse, status_code=status.HTTP_202_ACCEPTED)
+async def create_analysis_job(
+        file: UploadFile = File(...),
+        db: AsyncSession = Depends(get_db),
+        current_user: User = Depends(get_current_active_user_dependency),
+):
+    """Поставить изображение в очередь на анализ, не дожидаясь результата"""
+    if not file.content_type.startswith('image/'):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="File must be an image"
+        )
+
+    with phase("upload"):
+        stored = await save_upload(file)
+
+    image = build_image(current_user.id, stored, file.filename, file.content_type)
+    db.add(image)
+    await db.flush()
+
+    job = AnalysisJob(user_id=current_user.id, image_id=image.id, status=JOB_PENDING)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+
+    job_workers.notify()
+    return await _job_response(db, job)
+
+
+@router.get("/jobs/{job_id}", response_model=JobResponse)
+async def get_analysis_job(
+        job_id: int,
+        db: AsyncSession = Depends(get_db),
+        current_user: User = Depends(get_current_active_user_dependency),
+):
+    job = await _get_user_job(db, job_id, current_user.id)
+    return await _job_response(db, job)
+
+
+@router.get("/jobs/{job_id}/events")
+async def stream_analysis_job(
+        job_id: int,
         db: AsyncSession = Depends(get_db),
         current_user: User = Depends(get_current_active_user_dependency),
 ):
-    # Получаем результаты анализа для текущего пользователя
-    from sqlalchemy import select
-    from app.models.result import Result
-    from app.models.image import Image
+    """Server-Sent Events со статусом задачи до ее завершения"""
+    await _get_user_job(db, job_id, current_user.id)
+    user_id = current_user.id
+
+    async def events():
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.JOB_EVENTS_TIMEOUT_SECONDS
+        last_status = None
+        while True:
+            # Короткая сессия на каждую проверку, чтобы не держать соединение из пула
+            async with AsyncSessionLocal() as session:
+                job = await _get_user_job(session, job_id, user_id)
+                response = await _job_response(session, job)
+
+            if response.status != last_status:
+                last_status = response.status
+                yield f"event: status\ndata: {response.model_dump_json()}\n\n"
+
+            remaining = deadline - loop.time()
+            if response.status in (JOB_DONE, JOB_FAILED) or remaining <= 0:
+                break
+            # Воркер этого процесса будит подписчика сразу, чужой - найдем при опросе
+            await job_workers.wait_for_update(job_id, min(settings.JOB_POLL_INTERVAL_SECONDS, remaining))
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+@router.get("/results", response_model=list[ResultResponse])
+async def get_analysis_results(
+        request: Request,
+        cursor: Optional[str] = None,
+        limit: int = Query(20, ge=1, le=100),
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(get_current_active_user_dependency),
+):
+    """История анализов, новые сверху. Курсор следующей страницы - в заголовке X-Next-Cursor"""
+    tags = [results_tag(current_user.id)]
+    cached, cache_key = response_cache.lookup(request, tags)
+    if cached is not None:
+        return cached
+
+    # По результату на изображение, даже если оно анализировалось несколькими версиями модели
+    stmt = select(Result).where(Result.user_id == current_user.id, current_result_condition())
+    stmt = keyset_paginate(stmt, Result, cursor, limit)
+
+    rows = (await db.execute(stmt)).scalars().all()
+    results, next_cursor = split_page(rows, limit)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return response_cache.store(
+        request, cache_key,
+        to_json(_result_list_json, results),
+        make_etag(results, next_cursor),
+        headers,
+    )
+
+
+@router.get("/results/export")
+async def export_analysis_results(
+        request: Request,
+        export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(get_current_active_user_dependency),
+):
+    """Вся история анализов одним потоковым ответом (NDJSON или CSV), новые сверху"""
+    # Сессия проверки токена живет до конца ответа: закрываем ее, чтобы
+    # выгрузка не держала соединение и транзакцию; страницы читаются своими сессиями
+    await db.close()
+    filename = f"analysis-results.{export_format}"
+    return StreamingResponse(
+        export_results(request, current_user.id, export_format),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "Cache-Control": "private, no-store",
+        },
+    )
+
+
+@router.get("/results/{result_id}/similar", response_model=SimilarResultsResponse)
+async def get_similar_results(
+        result_id: int,
+        limit: int = Query(10, ge=1, le=100),
+        scope: Literal["user", "global"] = "user",
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(get_current_active_user_dependency),
+):
+    """Визуально похожие прошлые загрузки: свои (scope=user) или всех пользователей.
+
+    Поиск идет по индексу векторов в памяти. Найденные результаты сводятся
+    к показываемому результату своего изображения (как в истории), само
+    изображение запроса исключается. Чужие результаты возвращаются только
+    с близостью: ни содержимого, ни id (id последовательные и выдавали бы,
+    сколько результатов у других пользователей).
+    """
+    stmt = (
+        select(Result.user_id, Result.image_id, Image.content_hash)
+        .join(Image, Image.id == Result.image_id)
+        .where(Result.id == result_id)
+    )
+    source = (await db.execute(stmt)).first()
+    if source is None or source.user_id != current_user.id:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Result not found"
+        )
+
+    # С запасом: у изображения в индексе может быть по результату на версию модели
+    matches = await asyncio.to_thread(
+        find_similar, result_id, source.content_hash, limit * 2 + 1, current_user.id if scope == "user" else None
+    )
+    schedule_training()
+    if matches is None:
+        # Вектор считается в фоне после сохранения результата
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Result is not indexed yet"
+        )
+
+    images = {}
+    shown = {}
+    if matches:
+        stmt = select(Result.id, Result.image_id).where(Result.id.in_([match_id for match_id, _ in matches]))
+        images = dict((await db.execute(stmt)).all())
+        stmt = select(Result).where(Result.image_id.in_(set(images.values())), current_result_condition())
+        shown = {result.image_id: result for result in (await db.execute(stmt)).scalars()}
+
+    items = []
+    seen = {source.image_id}
+    for match_id, score in matches:
+        image_id = images.get(match_id)
+        if image_id in seen or image_id not in shown:
+            continue
+        seen.add(image_id)
+        result = shown[image_id]
+        own = result.user_id == current_user.id
+        items.append(SimilarResult(
+            result_id=result.id if own else None,
+            score=round(score, 4),
+            result=ResultResponse.model_validate(result) if own else None,
+        ))
+        if len(items) == limit:
+            break
 
-    stmt = select(Result).join(Image).where(Result.user_id == current_user.id)
-    stmt = stmt.offset(skip).limit(limit).order_by(Result.created_at.desc())
+    return SimilarResultsResponse(result_id=result_id, scope=scope, items=items)
 
-    result = await db.execute(stmt)
-    results = result.scalars().all()
 
-    return results
\ No newline at end of file
+@router.get("/summary", response_model=StyleSummaryResponse)
+async def get_style_summary(
+        db: AsyncSession = Depends(get_read_db),
+        current_user: User = Depends(get_current_active_user_dependency),
+):
+    """Стилевой профиль: распределение стилей, средняя уверенность, топ цветов"""
+    stmt = select(StyleSummary).where(StyleSummary.user_id == current_user.id)
+    summary = (await db.execute(stmt)).scalar_one_or_none()
+    return summary_response(current_user.id, summary)
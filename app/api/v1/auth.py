@@ -1,16 +1,55 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
 
-from app.core.db import get_db
-from app.services.auth_service import authenticate_user, register_user, create_access_token
-from app.schemas.auth import UserLogin, UserRegister, AuthResponse
+from app.core.config import settings
+from app.core.db import get_db, pin_to_primary
+from app.core.rate_limit import RateLimiter, client_ip
+from app.core.response_cache import USERS_TAG, response_cache
+from app.models.user import User
+from app.services.auth_service import (
+    authenticate_user,
+    create_access_token,
+    get_current_active_user_dependency,
+    register_user,
+)
+from app.services.session_service import create_session, revoke_session, revoke_user_sessions, rotate_session
+from app.schemas.auth import UserLogin, UserRegister, AuthResponse, RefreshRequest
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
-@router.post("/login", response_model=AuthResponse)
+# Лимиты проверяются до запросов в БД и bcrypt: отказ стоит микросекунды
+ip_limiter = RateLimiter("auth_ip", settings.AUTH_RATE_LIMIT_IP_BURST, settings.AUTH_RATE_LIMIT_IP_PER_MINUTE)
+email_limiter = RateLimiter(
+    "auth_email", settings.AUTH_RATE_LIMIT_EMAIL_BURST, settings.AUTH_RATE_LIMIT_EMAIL_PER_MINUTE
+)
+
+
+async def limit_by_ip(request: Request):
+    await ip_limiter.check(client_ip(request))
+
+
+def _token_response(user_id: int, refresh_token: str) -> AuthResponse:
+    access_token = create_access_token(
+        data={"sub": str(user_id)},
+        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return AuthResponse(
+        access_token=access_token,
+        refresh_token=refresh_token,
+        expires_in=settings.ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    )
+
+
+async def _issue_tokens(db: AsyncSession, user_id: int) -> AuthResponse:
+    refresh_token = await create_session(db, user_id)
+    return _token_response(user_id, refresh_token)
+
+
+@router.post("/login", response_model=AuthResponse, dependencies=[Depends(limit_by_ip)])
 async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
     """Аутентификация пользователя и выдача JWT токена"""
+    await email_limiter.check(user.email.lower())
     authenticated_user = await authenticate_user(db, user)
     if not authenticated_user:
         raise HTTPException(
@@ -19,17 +58,12 @@ async def login(user: UserLogin, db: AsyncSession = Depends(get_db)):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    access_token_expires = timedelta(minutes=30)
-    access_token = create_access_token(
-        data={"sub": str(authenticated_user.id)},  # или authenticated_user.email
-        expires_delta=access_token_expires
-    )
+    return await _issue_tokens(db, authenticated_user.id)
 
-    return AuthResponse(access_token=access_token)
-
-@router.post("/register", response_model=AuthResponse)
+@router.post("/register", response_model=AuthResponse, dependencies=[Depends(limit_by_ip)])
 async def register(user: UserRegister, db: AsyncSession = Depends(get_db)):
     """Регистрация нового пользователя и выдача JWT токена"""
+    await email_limiter.check(user.email.lower())
     try:
         new_user = await register_user(db, user)
     except HTTPException as e:
@@ -39,10 +73,36 @@ async def register(user: UserRegister, db: AsyncSession = Depends(get_db)):
         # Другие ошибки - добавляем сообщение
         raise HTTPException(status_code=400, detail=f"Ошибка регистрации: {str(e)}")
 
-    access_token_expires = timedelta(minutes=30)
-    access_token = create_access_token(
-        data={"sub": str(new_user.id)},
-        expires_delta=access_token_expires
-    )
+    # Следующие запросы нового пользователя не должны уйти на отстающую реплику
+    pin_to_primary(new_user.id)
+    response_cache.invalidate(USERS_TAG)
+    return await _issue_tokens(db, new_user.id)
+
+
+@router.post("/refresh", response_model=AuthResponse)
+async def refresh(body: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """Новая пара токенов по refresh-токену: один запрос в БД, без проверки пароля"""
+    rotated = await rotate_session(db, body.refresh_token)
+    if rotated is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired refresh token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    user_id, refresh_token = rotated
+    return _token_response(user_id, refresh_token)
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(body: RefreshRequest, db: AsyncSession = Depends(get_db)):
+    """Отозвать refresh-токен текущего устройства"""
+    await revoke_session(db, body.refresh_token)
+
 
-    return AuthResponse(access_token=access_token)
\ No newline at end of file
+@router.post("/logout-all", status_code=status.HTTP_204_NO_CONTENT)
+async def logout_all(
+        db: AsyncSession = Depends(get_db),
+        current_user: User = Depends(get_current_active_user_dependency),
+):
+    """Отозвать все refresh-сессии пользователя"""
+    await revoke_user_sessions(db, current_user.id)
\ No newline at end of file
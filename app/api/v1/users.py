@@ -1,28 +1,56 @@
-from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status, UploadFile, File
+from pydantic import TypeAdapter
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
-from app.core.db import get_db
-from app.services.auth_service import get_current_active_user_dependency
+from app.core.db import get_db, get_read_db
+from app.core.file_responses import IMMUTABLE_CACHE_CONTROL, conditional_file_response
+from app.core.pagination import keyset_paginate, split_page
+from app.core.response_cache import USERS_TAG, make_etag, response_cache, to_json, user_tag
+from app.services.auth_service import get_current_active_user_dependency, invalidate_user_cache
 from app.models.user import User
 from app.schemas.user import UserResponse
+from app.services.avatar_service import (
+    AVATAR_FILENAME_RE,
+    AVATAR_SIZES,
+    avatars_dir,
+    remove_avatar,
+    save_avatar,
+    thumbnail_name,
+)
 import os
-import shutil
-from fastapi.responses import FileResponse
 
 
 router = APIRouter(prefix="/users", tags=["users"])
 
+_user_json = TypeAdapter(UserResponse)
+_user_list_json = TypeAdapter(list[UserResponse])
+
 
 @router.get("/", response_model=list[UserResponse])
 async def list_users(
-        skip: int = 0,
-        limit: int = 100,
-        db: AsyncSession = Depends(get_db),
+        request: Request,
+        cursor: Optional[str] = None,
+        limit: int = Query(100, ge=1, le=500),
+        db: AsyncSession = Depends(get_read_db),
         current_user: User = Depends(get_current_active_user_dependency),
 ):
-    result = await db.execute(select(User).offset(skip).limit(limit))
-    users = result.scalars().all()
-    return users
+    """Список пользователей. Курсор следующей страницы - в заголовке X-Next-Cursor"""
+    cached, cache_key = response_cache.lookup(request, [USERS_TAG])
+    if cached is not None:
+        return cached
+
+    stmt = keyset_paginate(select(User), User, cursor, limit, descending=False)
+    result = await db.execute(stmt)
+    users, next_cursor = split_page(result.scalars().all(), limit)
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else {}
+    return response_cache.store(
+        request, cache_key,
+        to_json(_user_list_json, users),
+        make_etag(users, next_cursor),
+        headers,
+    )
 
 
 @router.get("/me", response_model=UserResponse)
@@ -36,9 +64,14 @@ async def get_current_user(
 @router.get("/{user_id}", response_model=UserResponse)
 async def get_user(
         user_id: int,
-        db: AsyncSession = Depends(get_db),
+        request: Request,
+        db: AsyncSession = Depends(get_read_db),
         current_user: User = Depends(get_current_active_user_dependency),
 ):
+    cached, cache_key = response_cache.lookup(request, [user_tag(user_id)])
+    if cached is not None:
+        return cached
+
     result = await db.execute(select(User).where(User.id == user_id))
     user = result.scalar_one_or_none()
 
@@ -48,7 +81,9 @@ async def get_user(
             detail="User not found"
         )
 
-    return user
+    return response_cache.store(
+        request, cache_key, to_json(_user_json, user), make_etag([user]),
+    )
 
 @router.post("/me/avatar", response_model=UserResponse)
 async def upload_avatar(
@@ -65,36 +100,73 @@ async def upload_avatar(
             detail="File must be an image"
         )
 
-    # Создаем папку для аватаров если её нет
-    avatars_dir = "uploads/avatars"
-    os.makedirs(avatars_dir, exist_ok=True)
+    # Оригинал и превью пишутся в пуле потоков, имя файла содержит хеш содержимого
+    filename = await save_avatar(current_user.id, file)
 
-    # Генерируем имя файла
-    file_extension = file.filename.split('.')[-1]
-    filename = f"avatar_{current_user.id}.{file_extension}"
-    file_path = os.path.join(avatars_dir, filename)
-
-    # Сохраняем файл
-    with open(file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    # Обновляем пользователя в БД
-    current_user.avatar_url = f"/api/v1/users/me/avatar/{filename}"
+    # Обновляем пользователя в БД (current_user может прийти из кеша, поэтому merge)
+    user = await db.merge(current_user)
+    previous_url = user.avatar_url
+    user.avatar_url = f"/api/v1/users/me/avatar/{filename}"
     await db.commit()
-    await db.refresh(current_user)
+    await db.refresh(user)
+    invalidate_user_cache(user.id)
+    response_cache.invalidate(USERS_TAG, user_tag(user.id))
 
-    return current_user
+    # Старые файлы больше не нужны: новый аватар получил новый URL
+    if previous_url and previous_url != user.avatar_url:
+        await remove_avatar(previous_url.rsplit("/", 1)[-1])
+
+    return user
 
 
 @router.get("/me/avatar/{filename}")
-async def get_avatar(filename: str):
-    """Получить аватар пользователя"""
-    file_path = f"uploads/avatars/{filename}"
+async def get_avatar(
+        filename: str,
+        request: Request,
+        size: Optional[int] = None,
+):
+    """Получить аватар пользователя или его превью (?size=64|128|256)"""
+    match = AVATAR_FILENAME_RE.fullmatch(filename)
+    if match is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Avatar not found"
+        )
+    digest = match.group(2)
 
-    if not os.path.exists(file_path):
+    if size is not None and size not in AVATAR_SIZES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Size must be one of {AVATAR_SIZES}"
+        )
+
+    if size is not None:
+        if digest is None:
+            # У аватаров старого формата превью нет
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Avatar not found"
+            )
+        path = os.path.join(avatars_dir(), thumbnail_name(filename.rsplit(".", 1)[0], size))
+        media_type = "image/webp"
+    else:
+        path = os.path.join(avatars_dir(), filename)
+        media_type = None
+
+    try:
+        stat = await asyncio.to_thread(os.stat, path)
+    except FileNotFoundError:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Avatar not found"
         )
 
-    return FileResponse(file_path)
\ No newline at end of file
+    if digest is None:
+        # Старый формат: файл перезаписывался на месте, кешировать навсегда нельзя
+        etag = f'"{int(stat.st_mtime)}-{stat.st_size}"'
+        cache_control = "no-cache"
+    else:
+        etag = f'"{digest}-{size or "orig"}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+
+    return await conditional_file_response(request, path, etag, cache_control, media_type, stat)
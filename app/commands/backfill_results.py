@@ -0,0 +1,261 @@
+"""Бэкфилл результатов анализа новой версией модели.
+
+Проходит по таблице images keyset-страницами по id (память не растет с
+размером таблицы, длинная транзакция не держится), анализирует изображения
+с ограниченной параллельностью и записывает Result пачкой upsert по
+(image_id, model_version). Одинаковые изображения анализируются один раз,
+готовые анализы этой версии берутся из БД. После каждой пачки прогресс
+пишется в файл контрольной точки, и повторный запуск продолжает с нее.
+Запуск из корня репозитория (MODEL_VERSION - версия развернутой модели):
+    python -m app.commands.backfill_results
+    python -m app.commands.backfill_results --model-version stub-v2 --concurrency 16
+    python -m app.commands.backfill_results --restart
+
+Изображения, у которых уже есть результат этой версии, пропускаются
+(--overwrite пересчитывает и их). Результаты прежних версий остаются, но
+в истории, выгрузке и профиле у изображения один результат (см.
+current_result_condition): профили в той же транзакции поправляются на
+разницу показываемых результатов. Новый результат получает created_at
+изображения, поэтому порядок истории не меняется. Пока версия не
+развернута, ее результаты видны только у изображений без результата
+MODEL_VERSION; после смены MODEL_VERSION профили пересобирает
+rebuild_style_summary.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import exists, func, select
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal, dialect_insert, engine
+from app.core.log import setup_logging, stop_logging
+from app.models.image import Image
+from app.models.result import Result
+from app.services.analysis_service import (
+    analyze_file,
+    current_result_condition,
+    find_cached_analyses,
+    inference_engine,
+    remember_analysis,
+    result_values,
+)
+from app.services.summary_service import SummaryDelta, apply_summary_delta
+
+logger = logging.getLogger("app.commands.backfill_results")
+
+# Колонки, которые upsert перезаписывает у существующего результата
+UPSERT_COLUMNS = ("style_type", "confidence_score", "dominant_colors", "analysis_data", "content_hash")
+
+
+@dataclass
+class Checkpoint:
+    model_version: str
+    last_image_id: int = 0
+    processed: int = 0
+    analyzed: int = 0
+    reused: int = 0
+    failed: int = 0
+
+    @classmethod
+    def load(cls, path: str, model_version: str) -> "Checkpoint":
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return cls(model_version)
+        if data.get("model_version") != model_version:
+            raise SystemExit(
+                f"Checkpoint {path} is for model version {data.get('model_version')}, "
+                f"use --restart or another --checkpoint"
+            )
+        return cls(**data)
+
+    def save(self, path: str):
+        # Через временный файл: прерывание посреди записи не портит контрольную точку
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(asdict(self), f)
+        os.replace(tmp_path, path)
+
+
+def _pending_images(model_version: str, overwrite: bool):
+    stmt = select(Image.id, Image.user_id, Image.image_path, Image.content_hash, Image.created_at)
+    if not overwrite:
+        done = exists().where(Result.image_id == Image.id, Result.model_version == model_version)
+        stmt = stmt.where(~done)
+    return stmt
+
+
+async def _shown_results(db, image_ids) -> dict:
+    """Показываемый результат каждого изображения: {image_id: строка}"""
+    stmt = (
+        select(Result.image_id, Result.id, Result.user_id, Result.style_type,
+               Result.confidence_score, Result.dominant_colors)
+        .where(Result.image_id.in_(image_ids), current_result_condition())
+    )
+    return {row.image_id: row for row in await db.execute(stmt)}
+
+
+def _summary_deltas(before: dict, after: dict) -> dict:
+    """Приращения профилей по пользователям при смене показываемых результатов"""
+    deltas = defaultdict(SummaryDelta)
+    for image_id, row in before.items():
+        if after.get(image_id) != row:
+            deltas[row.user_id].remove(row.style_type, row.confidence_score, json.loads(row.dominant_colors or "[]"))
+    for image_id, row in after.items():
+        if before.get(image_id) != row:
+            deltas[row.user_id].add(row.style_type, row.confidence_score, json.loads(row.dominant_colors or "[]"))
+    return deltas
+
+
+async def _analyze(path: str, content_hash: Optional[str], slots: asyncio.Semaphore):
+    async with slots:
+        try:
+            return await analyze_file(path, content_hash)
+        except HTTPException as e:
+            return e
+
+
+async def _process_page(
+        db, rows, model_version: str, overwrite: bool, slots: asyncio.Semaphore, checkpoint: Checkpoint,
+):
+    analyses = {}
+    if not overwrite:
+        hashes = [row.content_hash for row in rows if row.content_hash]
+        analyses = await find_cached_analyses(db, hashes, model_version)
+    checkpoint.reused += sum(1 for row in rows if row.content_hash in analyses)
+
+    # Уникальные изображения без готового анализа; без хеша - каждое отдельно
+    pending = {}
+    for row in rows:
+        if row.content_hash not in analyses:
+            pending.setdefault(row.content_hash or f"image:{row.id}", (row.image_path, row.content_hash))
+    fresh = dict(zip(pending, await asyncio.gather(
+        *(_analyze(path, content_hash, slots) for path, content_hash in pending.values())
+    )))
+    checkpoint.analyzed += len(pending)
+
+    values = []
+    for row in rows:
+        analysis = analyses.get(row.content_hash) or fresh.get(row.content_hash or f"image:{row.id}")
+        if isinstance(analysis, HTTPException):
+            logger.warning("Изображение %s не проанализировано: %s", row.id, analysis.detail)
+            checkpoint.failed += 1
+            continue
+        # Дата загрузки изображения: история упорядочена по created_at
+        values.append(result_values(row.id, row.user_id, row.content_hash, analysis, model_version)
+                      | {"created_at": row.created_at})
+
+    if values:
+        image_ids = [value["image_id"] for value in values]
+        before = await _shown_results(db, image_ids)
+        stmt = dialect_insert(db)(Result)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["image_id", "model_version"],
+            set_={column: stmt.excluded[column] for column in UPSERT_COLUMNS} | {"updated_at": func.now()},
+        )
+        await db.execute(stmt, values)
+        deltas = _summary_deltas(before, await _shown_results(db, image_ids))
+        # По возрастанию user_id: одинаковый порядок блокировок профилей
+        for user_id in sorted(deltas):
+            await apply_summary_delta(db, user_id, deltas[user_id])
+        await db.commit()
+
+    for content_hash, analysis in fresh.items():
+        if not isinstance(analysis, HTTPException) and not content_hash.startswith("image:"):
+            remember_analysis(content_hash, model_version, analysis)
+
+
+async def backfill(
+        model_version: str,
+        checkpoint_path: str,
+        batch_size: int = 500,
+        concurrency: int = 8,
+        overwrite: bool = False,
+        restart: bool = False,
+) -> Checkpoint:
+    checkpoint = Checkpoint(model_version) if restart else Checkpoint.load(checkpoint_path, model_version)
+    if checkpoint.last_image_id:
+        logger.info("Продолжение с изображения id > %d (обработано %d)", checkpoint.last_image_id, checkpoint.processed)
+
+    base = _pending_images(model_version, overwrite)
+    async with AsyncSessionLocal() as db:
+        remaining = await db.scalar(
+            select(func.count()).select_from(base.where(Image.id > checkpoint.last_image_id).subquery())
+        )
+    logger.info("К обработке: %d изображений, версия модели %s", remaining, model_version)
+
+    slots = asyncio.Semaphore(concurrency)
+    started = time.perf_counter()
+    done = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            stmt = base.where(Image.id > checkpoint.last_image_id).order_by(Image.id).limit(batch_size)
+            rows = (await db.execute(stmt)).all()
+            if not rows:
+                break
+            await _process_page(db, rows, model_version, overwrite, slots, checkpoint)
+
+        checkpoint.last_image_id = rows[-1].id
+        checkpoint.processed += len(rows)
+        checkpoint.save(checkpoint_path)
+
+        done += len(rows)
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed > 0 else 0.0
+        left = max(remaining - done, 0)
+        logger.info(
+            "Обработано %d/%d (%.1f изобр./с, осталось ~%.0f с): анализ %d, из кеша %d, ошибок %d",
+            done, remaining, rate, left / rate if rate else 0.0,
+            checkpoint.analyzed, checkpoint.reused, checkpoint.failed,
+        )
+
+    logger.info(
+        "Бэкфилл %s завершен: %d изображений за %.1f с, ошибок %d",
+        model_version, done, time.perf_counter() - started, checkpoint.failed,
+    )
+    return checkpoint
+
+
+async def main_async(args):
+    model_version = args.model_version or settings.MODEL_VERSION
+    checkpoint_path = args.checkpoint or f"backfill-{model_version}.json"
+    await inference_engine.start()
+    try:
+        await inference_engine.warmup()
+        await backfill(
+            model_version, checkpoint_path, args.batch_size, args.concurrency, args.overwrite, args.restart,
+        )
+    finally:
+        await inference_engine.stop()
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-analyze stored images with a model version")
+    parser.add_argument("--model-version", help="по умолчанию MODEL_VERSION из настроек")
+    parser.add_argument("--checkpoint", help="файл контрольной точки, по умолчанию backfill-<версия>.json")
+    parser.add_argument("--batch-size", type=int, default=500, help="изображений на страницу и транзакцию")
+    parser.add_argument("--concurrency", type=int, default=settings.BATCH_CONCURRENCY,
+                        help="одновременных анализов")
+    parser.add_argument("--overwrite", action="store_true", help="пересчитать и уже готовые результаты версии")
+    parser.add_argument("--restart", action="store_true", help="начать заново, игнорируя контрольную точку")
+    args = parser.parse_args()
+
+    setup_logging()
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Дозаполнение индекса похожих изображений по таблице results.
+
+Новые результаты индексируются приложением сразу после сохранения; команда
+нужна для результатов, сохраненных до появления индекса или пока файл
+индекса был недоступен. Уже проиндексированные результаты пропускаются,
+поэтому команду можно прерывать и запускать повторно.
+Запуск из корня репозитория:
+    python -m app.commands.build_similarity_index
+"""
+import argparse
+import asyncio
+import logging
+import time
+
+from sqlalchemy import select
+
+from app.core.db import AsyncSessionLocal, engine
+from app.core.log import setup_logging, stop_logging
+from app.ml.vector_index import content_key
+from app.models.image import Image
+from app.models.result import Result
+from app.services.similarity_service import embed_result, similarity_index
+
+logger = logging.getLogger("app.commands.build_similarity_index")
+
+
+async def build(chunk_size: int = 5000) -> int:
+    similarity_index.refresh()
+    stmt = (
+        select(Result.id, Result.user_id, Result.analysis_data, Image.content_hash, Image.image_path)
+        .join(Image, Image.id == Result.image_id)
+        .order_by(Result.id)
+        .execution_options(yield_per=chunk_size)
+    )
+
+    started = time.perf_counter()
+    added = failed = 0
+    async with AsyncSessionLocal() as reader:
+        result = await reader.stream(stmt)
+        async for row in result:
+            if similarity_index.has_result(row.id):
+                continue
+            key = content_key(row.content_hash)
+            vector = similarity_index.vector_for_key(key)
+            try:
+                if vector is None:
+                    vector = await asyncio.to_thread(
+                        embed_result, row.image_path, row.content_hash, row.analysis_data or {}
+                    )
+            except OSError as e:
+                logger.warning("Пропущен результат %s: %s", row.id, e)
+                failed += 1
+                continue
+            similarity_index.append(row.id, row.user_id, key, vector)
+            added += 1
+            if added % chunk_size == 0:
+                logger.info("Проиндексировано: %d", added)
+
+    logger.info(
+        "Индекс дополнен: %d векторов, пропущено %d, всего %d за %.1f с",
+        added, failed, len(similarity_index), time.perf_counter() - started,
+    )
+    return added
+
+
+async def main_async(args):
+    try:
+        await build(args.chunk_size)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Add missing results to the similarity index")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="строк results за одну выборку курсора")
+    args = parser.parse_args()
+
+    setup_logging()
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
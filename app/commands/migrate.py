@@ -0,0 +1,52 @@
+"""Обновление схемы БД миграциями Alembic, в том числе для баз без миграций.
+
+До перехода на Alembic схему при каждом старте создавал create_all, поэтому
+в старых базах таблицы есть, а alembic_version - нет, и alembic upgrade head
+падает на "relation already exists". Такая база помечается (stamp) ревизией
+0001 - схемой create_all тех времен, после чего применяются остальные ревизии.
+Запуск из корня репозитория (в docker-compose - сервис migrate):
+    python -m app.commands.migrate
+"""
+import asyncio
+import logging
+
+from alembic import command
+from sqlalchemy import inspect
+
+from app.core.db import engine
+from app.core.db_init import alembic_config
+from app.core.log import setup_logging, stop_logging
+
+logger = logging.getLogger("app.commands.migrate")
+
+# Ревизия, совпадающая со схемой create_all до перехода на миграции
+BASELINE_REVISION = "0001"
+
+
+async def _table_names() -> set:
+    try:
+        async with engine.connect() as conn:
+            return await conn.run_sync(lambda sync_conn: set(inspect(sync_conn).get_table_names()))
+    finally:
+        await engine.dispose()
+
+
+def migrate():
+    tables = asyncio.run(_table_names())
+    config = alembic_config()
+    if "alembic_version" not in tables and "users" in tables:
+        logger.info("База создана без миграций: помечаем ревизией %s", BASELINE_REVISION)
+        command.stamp(config, BASELINE_REVISION)
+    command.upgrade(config, "head")
+
+
+def main():
+    setup_logging()
+    try:
+        migrate()
+    finally:
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Пересборка стилевых профилей (style_summaries) по таблице results.
+
+Нужна после смены MODEL_VERSION (профиль считается по показываемому
+результату каждого изображения, см. current_result_condition) или ручных
+правок results. Результаты читаются потоком, упорядоченными по пользователю,
+поэтому в памяти - агрегаты только одного пользователя, а профили пишутся
+пачками по --commit-every.
+Запуск из корня репозитория:
+    python -m app.commands.rebuild_style_summary
+    python -m app.commands.rebuild_style_summary --user-id 42
+
+Результаты, вставленные во время пересборки, уже учтены инкрементально,
+но профиль пользователя, которого команда обработала раньше вставки,
+будет перезаписан без них - запускайте при низкой нагрузке.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from sqlalchemy import delete, select
+
+from app.core.db import AsyncSessionLocal, engine
+from app.core.log import setup_logging, stop_logging
+from app.models.result import Result
+from app.models.summary import StyleSummary
+from app.services.analysis_service import current_result_condition
+from app.services.summary_service import SummaryDelta, replace_summary
+
+logger = logging.getLogger("app.commands.rebuild_style_summary")
+
+
+def _colors(value):
+    if not value:
+        return []
+    try:
+        return json.loads(value)
+    except ValueError:
+        return []
+
+
+async def rebuild(user_id=None, chunk_size: int = 5000, commit_every: int = 500) -> int:
+    stmt = (
+        select(Result.user_id, Result.style_type, Result.confidence_score, Result.dominant_colors)
+        .where(current_result_condition())
+        .order_by(Result.user_id, Result.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    if user_id is not None:
+        stmt = stmt.where(Result.user_id == user_id)
+
+    started = time.perf_counter()
+    users = 0
+    rows = 0
+    current_user, delta = None, SummaryDelta()
+
+    # Чтение и запись - в разных сессиях: соединение с открытым курсором занято
+    async with AsyncSessionLocal() as reader, AsyncSessionLocal() as writer:
+        result = await reader.stream(stmt)
+        async for row in result:
+            if row.user_id != current_user:
+                if current_user is not None:
+                    await replace_summary(writer, current_user, delta)
+                    users += 1
+                    if users % commit_every == 0:
+                        await writer.commit()
+                        logger.info("Пересобрано профилей: %d, результатов: %d", users, rows)
+                current_user, delta = row.user_id, SummaryDelta()
+            delta.add(row.style_type, row.confidence_score, _colors(row.dominant_colors))
+            rows += 1
+
+        if current_user is not None:
+            await replace_summary(writer, current_user, delta)
+            users += 1
+
+        # Профили пользователей, у которых не осталось результатов
+        stale = delete(StyleSummary).where(StyleSummary.user_id.not_in(select(Result.user_id).distinct()))
+        if user_id is not None:
+            stale = stale.where(StyleSummary.user_id == user_id)
+        await writer.execute(stale)
+        await writer.commit()
+
+    logger.info(
+        "Пересборка завершена: %d профилей, %d результатов за %.1f с",
+        users, rows, time.perf_counter() - started,
+    )
+    return users
+
+
+async def main_async(args):
+    try:
+        await rebuild(args.user_id, args.chunk_size, args.commit_every)
+    finally:
+        await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild per-user style summaries from results")
+    parser.add_argument("--user-id", type=int, help="только этот пользователь")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="строк results за одну выборку курсора")
+    parser.add_argument("--commit-every", type=int, default=500, help="профилей на транзакцию")
+    args = parser.parse_args()
+
+    setup_logging()
+    try:
+        asyncio.run(main_async(args))
+    finally:
+        stop_logging()
+
+
+if __name__ == "__main__":
+    main()
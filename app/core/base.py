@@ -1,9 +1,16 @@
+from datetime import timedelta
+
 from sqlalchemy import MetaData
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from sqlalchemy import Column, Integer, DateTime, func
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import DATETIME as SQLITE_DATETIME
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from app.core.config import settings
+from app.core.metrics import InstrumentedQueuePool, instrument_engine
 
 # Конвенция имен для БД
 convention = {
@@ -21,21 +28,93 @@ class Base(DeclarativeBase):
     metadata = metadata
 
 
+# В SQLite func.now() пишет время без микросекунд ("YYYY-MM-DD HH:MM:SS"), а значения
+# из Python по умолчанию пишутся с ними. Время там хранится строкой, поэтому без единого
+# формата сравнения (например, keyset-пагинация по created_at) работают неверно
+Timestamp = DateTime().with_variant(
+    SQLITE_DATETIME(
+        storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"
+    ),
+    "sqlite",
+)
+
+
 # Базовый класс для всех моделей
 class BaseModel(Base):
     __abstract__ = True
 
     id = Column(Integer, primary_key=True, index=True)
-    created_at = Column(DateTime, default=func.now())
-    updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    created_at = Column(Timestamp, default=func.now())
+    updated_at = Column(Timestamp, default=func.now(), onupdate=func.now())
 
 
 # Создаем движок и сессии
-engine = create_async_engine(settings.DATABASE_URL, echo=True)
+engine = create_async_engine(
+    settings.DATABASE_URL,
+    echo=settings.SQL_ECHO,
+    poolclass=InstrumentedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+)
+instrument_engine(engine, "primary")
+
+
+class PrimarySession(Session):
+    """Сессия основной БД; на ее события подписан read-your-writes (app.core.read_replica)"""
+
+
 AsyncSessionLocal = sessionmaker(
-    engine, class_=AsyncSession, expire_on_commit=False
+    engine, class_=AsyncSession, expire_on_commit=False, sync_session_class=PrimarySession
 )
 
+class ReplicaSession(Session):
+    """Сессия реплики: соединение берется только при первом запросе.
+
+    Если реплика не отвечает, сессия продолжает работу на основной БД
+    (отказ замечает app.core.read_replica по событию after_begin).
+    """
+
+    def _connection_for_bind(self, bind, execution_options=None, **kw):
+        try:
+            return super()._connection_for_bind(bind, execution_options, **kw)
+        except (DBAPIError, OSError):
+            if replica_engine is None or bind is not replica_engine.sync_engine:
+                raise
+            self.bind = engine.sync_engine
+            return super()._connection_for_bind(self.bind, execution_options, **kw)
+
+
+# Реплика для чтения (необязательна): без DATABASE_REPLICA_URL все читается с основной БД
+replica_engine = None
+ReplicaSessionLocal = None
+if settings.DATABASE_REPLICA_URL:
+    replica_engine = create_async_engine(
+        settings.DATABASE_REPLICA_URL,
+        echo=settings.SQL_ECHO,
+        poolclass=InstrumentedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        # asyncpg (и aiosqlite) принимают timeout: недоступная реплика не держит запрос долго
+        connect_args={"timeout": settings.REPLICA_CONNECT_TIMEOUT_SECONDS},
+    )
+    instrument_engine(replica_engine, "replica")
+    ReplicaSessionLocal = sessionmaker(
+        replica_engine, class_=AsyncSession, expire_on_commit=False, sync_session_class=ReplicaSession
+    )
+
+
+def dialect_insert(db: AsyncSession):
+    """insert() диалекта сессии: нужен для ON CONFLICT (upsert)"""
+    return pg_insert if db.bind.dialect.name == "postgresql" else sqlite_insert
+
+
+def db_time_ago(db: AsyncSession, seconds: float):
+    """Момент seconds секунд назад по часам БД - тем же, что пишут created_at/updated_at"""
+    if db.bind.dialect.name == "sqlite":
+        # CURRENT_TIMESTAMP в SQLite - строка UTC в формате Timestamp
+        return func.datetime("now", f"-{int(seconds)} seconds")
+    return func.now() - timedelta(seconds=seconds)
+
 
 # Dependency для получения сессии БД
 async def get_db():
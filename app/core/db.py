@@ -1,3 +1,7 @@
-from app.core.base import engine, Base, BaseModel, get_db, AsyncSessionLocal
+from app.core.base import engine, Base, BaseModel, get_db, AsyncSessionLocal, db_time_ago, dialect_insert
+from app.core.read_replica import get_read_db, pin_to_primary, read_session
 
-__all__ = ["Base", "BaseModel", "engine", "get_db", "AsyncSessionLocal"]
\ No newline at end of file
+__all__ = [
+    "Base", "BaseModel", "engine", "get_db", "get_read_db", "pin_to_primary", "read_session", "AsyncSessionLocal",
+    "db_time_ago", "dialect_insert",
+]
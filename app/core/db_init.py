@@ -1,15 +1,67 @@
+import asyncio
+import logging
+import os
+
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+
 from app.core.db import engine, Base
 from app.core.config import settings
 
+logger = logging.getLogger(__name__)
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(__file__))), "alembic.ini")
+
+
+def alembic_config() -> Config:
+    return Config(ALEMBIC_INI)
+
 
 async def init_database():
-    """Инициализация базы данных - создание всех таблиц"""
-    async with engine.begin() as conn:
-        # if settings.RESET_DATABASE:
-        #     print("🔄 RESET_DATABASE=true - Dropping all tables...")
-        #     await conn.run_sync(Base.metadata.drop_all)
-        #     print("✅ All tables dropped")
+    """Создание всех таблиц без миграций - только для разработки и тестов.
 
-        print("🔄 Creating tables...")
+    В остальных окружениях схема ведется Alembic: python -m app.commands.migrate
+    """
+    async with engine.begin() as conn:
+        logger.info("Creating tables...")
         await conn.run_sync(Base.metadata.create_all)
-        print("✅ All tables created successfully")
\ No newline at end of file
+        logger.info("All tables created successfully")
+
+
+def _stamp_head(sync_conn):
+    script = ScriptDirectory.from_config(alembic_config())
+    MigrationContext.configure(sync_conn).stamp(script, "head")
+
+
+async def reset_database():
+    """Удалить все таблицы (RESET_DATABASE), создать схему заново и пометить ее head.
+
+    Таблицы берутся из metadata, поэтому новые модели не нужно добавлять
+    вручную. Схема после create_all совпадает с последней миграцией, и
+    без пометки python -m app.commands.migrate стал бы применять миграции
+    к уже готовым таблицам.
+    """
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.execute(text("DROP TABLE IF EXISTS alembic_version"))
+        logger.info("Старые таблицы удалены")
+    await init_database()
+    async with engine.begin() as conn:
+        await conn.run_sync(_stamp_head)
+
+
+async def ping_database():
+    async with engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+
+async def warm_up_pool(connections: int = settings.DB_WARMUP_CONNECTIONS):
+    """Заранее открыть соединения пула, чтобы первые запросы их не ждали.
+
+    Соединения берутся одновременно, иначе пул отдавал бы одно и то же.
+    """
+    pool = engine.sync_engine.pool
+    size = pool.size() if hasattr(pool, "size") else 1
+    await asyncio.gather(*(ping_database() for _ in range(max(min(connections, size), 1))))
@@ -0,0 +1,112 @@
+import asyncio
+import os
+import re
+from typing import Iterator, Optional, Tuple
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+CHUNK_SIZE = 64 * 1024
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка If-None-Match (слабое сравнение, как требует RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    plain = etag.removeprefix("W/")
+    return any(tag.removeprefix("W/") == plain for tag in candidates)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Один диапазон из заголовка Range -> (start, end) включительно.
+
+    None - заголовок не поддерживается (несколько диапазонов, другие единицы),
+    тогда отдается весь файл. Невыполнимый диапазон - 416.
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header)
+    if not match or not any(match.groups()):
+        return None
+
+    start_text, end_text = match.groups()
+    if start_text:
+        start = int(start_text)
+        end = min(int(end_text), size - 1) if end_text else size - 1
+    else:
+        # bytes=-N - последние N байт
+        length = int(end_text)
+        start = max(size - length, 0)
+        end = size - 1
+
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"},
+        )
+    return start, end
+
+
+def _iter_file_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    # Синхронный генератор: StreamingResponse читает его в пуле потоков
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+async def conditional_file_response(
+        request: Request,
+        path: str,
+        etag: str,
+        cache_control: str,
+        media_type: Optional[str] = None,
+        stat: Optional[os.stat_result] = None,
+) -> Response:
+    """Отдать файл с поддержкой If-None-Match (304) и Range (206).
+
+    stat - уже полученный результат os.stat(path), чтобы не повторять вызов.
+    """
+    headers = {
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+    # Сначала проверяем, что файл есть: иначе на удаленный файл с неизменяемым
+    # ETag клиент получал бы 304 и продолжал показывать его из кеша
+    if stat is None:
+        try:
+            stat = await asyncio.to_thread(os.stat, path)
+        except FileNotFoundError:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="File not found"
+            )
+    size = stat.st_size
+
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    range_header = request.headers.get("range")
+    byte_range = parse_range(range_header, size) if range_header else None
+    if byte_range is None:
+        return FileResponse(path, headers=headers, media_type=media_type)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        _iter_file_range(path, start, end),
+        status_code=status.HTTP_206_PARTIAL_CONTENT,
+        headers=headers,
+        media_type=media_type,
+    )
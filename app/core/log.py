@@ -0,0 +1,149 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+# id текущего HTTP-запроса, попадает в каждую запись лога
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+# Стандартные атрибуты LogRecord: все остальное пришло через extra=
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id", "taskName"}
+
+_listener: Optional[QueueListener] = None
+_handler: Optional[QueueHandler] = None
+
+
+class RequestIdFilter(logging.Filter):
+    """Запоминает request_id в записи, пока она еще в потоке, где создана"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей ниже WARNING для заданных логгеров.
+
+    rates: префикс имени логгера -> доля от 0 до 1, берется самый длинный
+    подходящий префикс. Предупреждения и ошибки не отбрасываются никогда.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = sorted(rates.items(), key=lambda item: len(item[0]), reverse=True)
+
+    def _rate(self, name: str) -> float:
+        for prefix, rate in self.rates:
+            if name == prefix or name.startswith(prefix + "."):
+                return rate
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        rate = self._rate(record.name)
+        return rate >= 1.0 or random.random() < rate
+
+
+_plain_formatter = logging.Formatter()
+
+
+class _QueueHandler(QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Стандартный prepare форматирует запись целиком; здесь только подставляем
+        # аргументы в сообщение, а трассировку сохраняем отдельно от него
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _plain_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна строка JSON"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def setup_logging():
+    """Логи приложения через очередь: запись в stdout идет в отдельном потоке.
+
+    В event loop остается только постановка записи в очередь. Отключенные
+    уровни отсекаются до форматирования, поэтому debug-записи почти бесплатны.
+    """
+    global _listener, _handler
+    if _listener is not None:
+        return
+
+    output = logging.StreamHandler(sys.stdout)
+    if settings.LOG_JSON:
+        output.setFormatter(JsonFormatter())
+    else:
+        output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s"))
+
+    log_queue = queue.SimpleQueue()
+    _handler = _QueueHandler(log_queue)
+    _handler.addFilter(SamplingFilter(settings.LOG_SAMPLE_RATES))
+    _handler.addFilter(RequestIdFilter())
+
+    logger = logging.getLogger("app")
+    logger.setLevel(settings.LOG_LEVEL.upper())
+    logger.addHandler(_handler)
+    logger.propagate = False
+
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Дописать записи из очереди и остановить поток вывода"""
+    global _listener, _handler
+    if _listener is not None:
+        logging.getLogger("app").removeHandler(_handler)
+        _listener.stop()
+        _listener = None
+        _handler = None
+
+
+def _restart_after_fork():
+    # Поток вывода не переживает fork: в дочернем процессе (воркер gunicorn
+    # после preload, процесс пула инференса) запускаем свой
+    global _listener, _handler
+    if _listener is not None:
+        logging.getLogger("app").removeHandler(_handler)
+        _listener = None
+        _handler = None
+        setup_logging()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
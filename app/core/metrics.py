@@ -0,0 +1,208 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests", ["method", "route", "status"]
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"]
+)
+DB_QUERY_DURATION = Histogram(
+    "db_query_duration_seconds", "Duration of a single SQL statement", ["engine"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "SQL statements executed per HTTP request", ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    "db_time_per_request_seconds", "Total SQL time per HTTP request", ["route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection", ["engine"],
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5),
+)
+DB_READ_ROUTING = Counter(
+    "db_read_routing_total", "Read-only sessions by target database", ["target", "reason"]
+)
+DB_N_PLUS_ONE = Counter(
+    "db_n_plus_one_warnings_total", "Requests exceeding DB_N_PLUS_ONE_THRESHOLD queries", ["route"]
+)
+
+
+@dataclass
+class RequestStats:
+    """Статистика текущего запроса: БД заполняют хуки SQLAlchemy, фазы - phase()"""
+    query_count: int = 0
+    db_time: float = 0.0
+    pool_wait: float = 0.0
+    slowest_time: float = 0.0
+    slowest_statement: Optional[str] = None
+    # Имя фазы -> суммарное время, с
+    phases: Dict[str, float] = field(default_factory=dict)
+
+
+request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+
+@contextmanager
+def phase(name: str):
+    """Замерить фазу запроса (auth, upload, inference...) для Server-Timing.
+
+    Работает и в пуле потоков: asyncio.to_thread копирует контекст вместе
+    с RequestStats. Вне запроса ничего не делает.
+    """
+    stats = request_stats.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.phases[name] = stats.phases.get(name, 0.0) + time.perf_counter() - start
+
+
+def server_timing(stats: RequestStats, total: float) -> str:
+    """Значение заголовка Server-Timing: фазы, БД и полное время, мс"""
+    metrics = [f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in stats.phases.items()]
+    if stats.query_count:
+        metrics.append(f'db;dur={stats.db_time * 1000:.1f};desc="{stats.query_count} sql"')
+    if stats.pool_wait >= 0.0005:
+        metrics.append(f"db-pool;dur={stats.pool_wait * 1000:.1f}")
+    metrics.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(metrics)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """Пул соединений, замеряющий ожидание свободного соединения"""
+
+    engine_name = "primary"
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            elapsed = time.perf_counter() - start
+            DB_POOL_WAIT.labels(self.engine_name).observe(elapsed)
+            stats = request_stats.get()
+            if stats is not None:
+                stats.pool_wait += elapsed
+
+
+# SQLAlchemy пишет отладку пула в логгер с именем класса, то есть внутри дерева "app"
+logging.getLogger(f"{__name__}.InstrumentedQueuePool").setLevel(logging.WARNING)
+
+
+# Движки, пулы которых выводятся в /metrics: имя -> движок
+_engines: Dict[str, AsyncEngine] = {}
+
+
+def instrument_engine(engine: AsyncEngine, name: str = "primary"):
+    """Подключить хуки замера запросов и метрики пула к движку"""
+    sync_engine = engine.sync_engine
+    if isinstance(sync_engine.pool, InstrumentedQueuePool):
+        sync_engine.pool.engine_name = name
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_start = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._query_start
+        DB_QUERY_DURATION.labels(name).observe(elapsed)
+
+        stats = request_stats.get()
+        if stats is None:
+            return
+        stats.query_count += 1
+        stats.db_time += elapsed
+        if elapsed > stats.slowest_time:
+            stats.slowest_time = elapsed
+            stats.slowest_statement = statement[:200]
+
+    _engines[name] = engine
+
+
+class _PoolCollector:
+    def collect(self):
+        gauges = [
+            ("db_pool_size", "Configured pool size", lambda pool: pool.size()),
+            ("db_pool_checked_out", "Connections currently checked out", lambda pool: pool.checkedout()),
+            ("db_pool_overflow", "Connections opened above pool size", lambda pool: max(pool.overflow(), 0)),
+        ]
+        for metric, doc, value in gauges:
+            gauge = GaugeMetricFamily(metric, doc, labels=["engine"])
+            for name, engine in _engines.items():
+                pool = engine.sync_engine.pool
+                if isinstance(pool, AsyncAdaptedQueuePool):
+                    gauge.add_metric([name], value(pool))
+            yield gauge
+
+
+REGISTRY.register(_PoolCollector())
+
+
+# Кеши, статистика которых выводится в /metrics: имя -> функция stats()
+_caches: Dict[str, Callable[[], dict]] = {}
+
+
+def register_cache(name: str, stats: Callable[[], dict]):
+    _caches[name] = stats
+
+
+class _CacheCollector:
+    def collect(self):
+        hits = CounterMetricFamily("cache_hits", "Cache hits", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache misses", labels=["cache"])
+        size = GaugeMetricFamily("cache_size", "Entries in cache", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Cache hit ratio", labels=["cache"])
+        for name, stats_fn in _caches.items():
+            stats = stats_fn()
+            hits.add_metric([name], stats["hits"])
+            misses.add_metric([name], stats["misses"])
+            size.add_metric([name], stats["size"])
+            ratio.add_metric([name], stats.get("total_hit_ratio", stats["hit_ratio"]))
+        yield from (hits, misses, size, ratio)
+
+
+REGISTRY.register(_CacheCollector())
+
+
+def observe_request(method: str, route: str, status_code: int, elapsed: float, stats: RequestStats):
+    HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+    HTTP_LATENCY.labels(method, route).observe(elapsed)
+    DB_QUERIES_PER_REQUEST.labels(route).observe(stats.query_count)
+    DB_TIME_PER_REQUEST.labels(route).observe(stats.db_time)
+
+    if stats.query_count > settings.DB_N_PLUS_ONE_THRESHOLD:
+        DB_N_PLUS_ONE.labels(route).inc()
+        logger.warning(
+            "Возможный N+1: %s %s выполнил %d запросов", method, route, stats.query_count,
+            extra={
+                "db_time_ms": round(stats.db_time * 1000, 1),
+                "slowest_ms": round(stats.slowest_time * 1000, 1),
+                "slowest_statement": stats.slowest_statement,
+            },
+        )
+
+
+def render_metrics() -> tuple:
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
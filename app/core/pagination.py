@@ -0,0 +1,61 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import List, Optional, Sequence, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import Select, literal, tuple_
+
+
+def encode_cursor(created_at: datetime, row_id: int) -> str:
+    """Непрозрачный курсор из ключа последней строки страницы"""
+    raw = json.dumps([created_at.isoformat(), row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, row_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def keyset_paginate(
+        stmt: Select,
+        model,
+        cursor: Optional[str],
+        limit: int,
+        descending: bool = True,
+) -> Select:
+    """Страница по ключу (created_at, id) вместо OFFSET.
+
+    Запрашивается limit + 1 строка: лишняя показывает, что есть следующая страница.
+    Время выборки не зависит от глубины страницы при индексе на (..., created_at, id).
+    """
+    key = tuple_(model.created_at, model.id)
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        # Типы берем из колонок, чтобы значение курсора сериализовалось так же, как в БД
+        last = tuple_(literal(created_at, model.created_at.type), literal(row_id, model.id.type))
+        stmt = stmt.where(key < last if descending else key > last)
+
+    if descending:
+        stmt = stmt.order_by(model.created_at.desc(), model.id.desc())
+    else:
+        stmt = stmt.order_by(model.created_at.asc(), model.id.asc())
+    return stmt.limit(limit + 1)
+
+
+def split_page(rows: Sequence, limit: int) -> Tuple[List, Optional[str]]:
+    """Отрезать лишнюю строку и построить курсор следующей страницы"""
+    items = list(rows[:limit])
+    if len(rows) <= limit or not items:
+        return items, None
+    last = items[-1]
+    return items, encode_cursor(last.created_at, last.id)
@@ -0,0 +1,144 @@
+"""Сэмплирующий профайлер отдельных запросов.
+
+Пока идет запрос, фоновый поток каждые PROFILE_INTERVAL_MS снимает стеки
+потока цикла событий и потоков asyncio.to_thread (sys._current_frames)
+и считает одинаковые стеки; простаивающие потоки пропускаются.
+Результат пишется в PROFILE_DIR в формате folded stacks
+("поток;модуль:функция;... число"), который понимают flamegraph.pl,
+speedscope и inferno.
+
+Запрос профилируется, если в нем заголовок X-Profile с PROFILE_TOKEN или
+если он попал в долю PROFILE_SAMPLE_RATE. Имя файла профиля возвращается
+в ответе только на запрос с токеном; профили выборки видны лишь в логе. Накладные расходы ограничены:
+в процессе одновременно работает один профайлер, сэмплирование
+останавливается через PROFILE_MAX_SECONDS. Цикл событий общий, поэтому при
+параллельных запросах в профиль попадают и они. Инференс идет в отдельных
+процессах и в профиль не попадает; для потоковых ответов профиль
+заканчивается на отправке заголовков.
+"""
+import hmac
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = "x-profile"
+
+# Потоки пула по умолчанию, в котором выполняется asyncio.to_thread
+_EXECUTOR_PREFIX = "asyncio_"
+
+# Листовые кадры простаивающих потоков: ожидание событий цикла, очереди, блокировки
+_IDLE_FRAMES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+# Один профайлер на процесс
+_active = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+class SamplingProfiler:
+    """Фоновый поток, сэмплирующий стеки цикла событий и пула потоков"""
+
+    def __init__(self, loop_thread: int, interval: float, max_seconds: float):
+        self.loop_thread = loop_thread
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            name = names.get(ident, "")
+            if ident != self.loop_thread and not name.startswith(_EXECUTOR_PREFIX):
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(name)
+            self.stacks[";".join(reversed(stack))] += 1
+        self.samples += 1
+
+    def _run(self):
+        deadline = time.monotonic() + self.max_seconds
+        while not self._stop.wait(self.interval):
+            if time.monotonic() > deadline:
+                logger.info("Профилирование остановлено через %.0f с", self.max_seconds)
+                return
+            self._sample()
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def profile_requested(headers) -> bool:
+    """Запрошен ли профиль привилегированным заголовком X-Profile с PROFILE_TOKEN"""
+    token = headers.get(PROFILE_HEADER)
+    return bool(token and settings.PROFILE_TOKEN and hmac.compare_digest(token, settings.PROFILE_TOKEN))
+
+
+def sampled() -> bool:
+    """Попал ли запрос в случайную выборку PROFILE_SAMPLE_RATE"""
+    return settings.PROFILE_SAMPLE_RATE > 0 and random.random() < settings.PROFILE_SAMPLE_RATE
+
+
+def start_profiler() -> Optional[SamplingProfiler]:
+    """Запустить профайлер или вернуть None, если другой запрос уже профилируется.
+
+    Вызывать из потока цикла событий.
+    """
+    if not _active.acquire(blocking=False):
+        return None
+    profiler = SamplingProfiler(
+        threading.get_ident(), settings.PROFILE_INTERVAL_MS / 1000, settings.PROFILE_MAX_SECONDS,
+    )
+    profiler.start()
+    return profiler
+
+
+def finish_profiler(profiler: SamplingProfiler, name: str) -> str:
+    """Остановить профайлер и записать профиль; возвращает имя файла.
+
+    Блокирующая функция: вызывать в пуле потоков.
+    """
+    try:
+        profiler.stop()
+    finally:
+        _active.release()
+    directory = settings.PROFILE_DIR or os.path.join(settings.UPLOAD_DIR, "profiles")
+    os.makedirs(directory, exist_ok=True)
+    filename = f"{datetime.utcnow():%Y%m%dT%H%M%S}-{name}.folded"
+    with open(os.path.join(directory, filename), "w") as f:
+        f.write(profiler.folded())
+    logger.info("Профиль записан: %s (%d сэмплов)", filename, profiler.samples)
+    return filename
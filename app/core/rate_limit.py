@@ -0,0 +1,149 @@
+import math
+import time
+from collections import OrderedDict
+from typing import Optional, Protocol, Tuple
+
+from fastapi import HTTPException, Request, status
+from prometheus_client import Counter
+
+from app.core.config import settings
+
+RATE_LIMIT_CHECKS = Counter(
+    "rate_limit_checks_total", "Rate limiter checks", ["limiter"]
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    "rate_limit_rejections_total", "Requests rejected by a rate limiter", ["limiter"]
+)
+
+
+class BucketBackend(Protocol):
+    async def take(self, key: str, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        """Взять один токен из корзины key. Возвращает (разрешено, секунд до следующего токена)"""
+
+
+class MemoryBucketBackend:
+    """Корзины в памяти процесса: O(1) на проверку, не больше max_keys корзин.
+
+    Корзины не общие между воркерами: при N процессах клиент получает до
+    N лимитов. Для нескольких воркеров или хостов - RedisBucketBackend.
+
+    Давно не использованные корзины вытесняются (LRU). Вытесненная корзина
+    при следующем обращении снова полная, поэтому max_keys должен заметно
+    превышать число ключей, активных в пределах окна пополнения.
+    """
+
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._buckets: OrderedDict = OrderedDict()
+
+    async def take(self, key: str, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+        retry_after = 0.0 if allowed else (1 - tokens) / refill_per_second
+        return allowed, retry_after
+
+
+# Та же логика атомарно на стороне Redis: корзина - hash {tokens, updated}
+_REDIS_TAKE = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or capacity
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisBucketBackend:
+    """Общие корзины для всех процессов и хостов. Требует пакет redis"""
+
+    def __init__(self, url: str, prefix: str = "ratelimit:"):
+        try:
+            from redis import asyncio as aioredis
+        except ImportError:
+            raise RuntimeError("RATE_LIMIT_BACKEND=redis requires the 'redis' package")
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url)
+        self._script = self._redis.register_script(_REDIS_TAKE)
+
+    async def take(self, key: str, capacity: float, refill_per_second: float) -> Tuple[bool, float]:
+        allowed, tokens = await self._script(
+            keys=[self.prefix + key],
+            args=[capacity, refill_per_second, time.time()],
+        )
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / refill_per_second
+
+
+def create_backend() -> BucketBackend:
+    if settings.RATE_LIMIT_BACKEND == "redis":
+        return RedisBucketBackend(settings.REDIS_URL)
+    return MemoryBucketBackend(settings.RATE_LIMIT_MAX_KEYS)
+
+
+class RateLimiter:
+    """Token bucket: burst запросов сразу, дальше per_minute в минуту"""
+
+    def __init__(self, name: str, burst: int, per_minute: float, backend: Optional[BucketBackend] = None):
+        self.name = name
+        self.capacity = burst
+        self.refill_per_second = per_minute / 60
+        self.backend = backend
+
+    async def check(self, key: str):
+        """Бросить 429, если для key исчерпан лимит"""
+        if not settings.RATE_LIMIT_ENABLED:
+            return
+        if self.backend is None:
+            self.backend = _default_backend()
+
+        RATE_LIMIT_CHECKS.labels(self.name).inc()
+        allowed, retry_after = await self.backend.take(
+            f"{self.name}:{key}", self.capacity, self.refill_per_second
+        )
+        if not allowed:
+            RATE_LIMIT_REJECTIONS.labels(self.name).inc()
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many attempts, try again later",
+                headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+            )
+
+
+_backend: Optional[BucketBackend] = None
+
+
+def _default_backend() -> BucketBackend:
+    # Создается при первой проверке, чтобы импорт модуля не требовал Redis
+    global _backend
+    if _backend is None:
+        _backend = create_backend()
+    return _backend
+
+
+def client_ip(request: Request) -> str:
+    """IP клиента. За балансировщиком request.client - адрес самого балансировщика,
+    и все клиенты делили бы одну корзину; uvicorn заменяет его адресом из
+    X-Forwarded-For, если запрос пришел от адреса из FORWARDED_ALLOW_IPS
+    (app.serve передает настройку gunicorn, uvicorn читает ее из окружения).
+    """
+    return request.client.host if request.client else "unknown"
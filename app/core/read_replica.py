@@ -0,0 +1,180 @@
+import hashlib
+import hmac
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from fastapi import Request, Response
+from jose import JWTError, jwt
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.base import AsyncSessionLocal, PrimarySession, ReplicaSession, ReplicaSessionLocal, replica_engine
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import DB_READ_ROUTING
+
+logger = logging.getLogger(__name__)
+
+# Пользователь текущего запроса; выставляется при проверке токена
+current_user_id: ContextVar[Optional[int]] = ContextVar("current_user_id", default=None)
+
+# Пользователи, недавно писавшие в основную БД: user_id -> True (в этом процессе).
+# Другим воркерам закрепление передает клиент: подписанная cookie PIN_COOKIE
+# с user_id и временем окончания, ее проверяет _read_target
+_pinned = TTLCache(settings.READ_YOUR_WRITES_MAX_USERS, settings.READ_YOUR_WRITES_SECONDS)
+PIN_COOKIE = "rw_pin"
+
+# Закрепления, сделанные за текущий запрос: user_id -> время окончания (unix)
+_request_pins: ContextVar[Optional[dict]] = ContextVar("request_pins", default=None)
+
+# Время (monotonic), до которого реплика считается недоступной
+_replica_down_until = 0.0
+
+
+def _pin_signature(user_id: int, until: int) -> str:
+    message = f"{user_id}:{until}".encode()
+    return hmac.new(settings.SECRET_KEY.encode(), message, hashlib.sha256).hexdigest()[:32]
+
+
+def pin_to_primary(user_id: Optional[int]):
+    """Читать данные пользователя с основной БД READ_YOUR_WRITES_SECONDS секунд"""
+    if user_id is not None and replica_engine is not None:
+        _pinned.set(user_id, True)
+        pins = _request_pins.get()
+        if pins is not None:
+            pins[user_id] = int(time.time() + settings.READ_YOUR_WRITES_SECONDS) + 1
+
+
+@contextmanager
+def collect_pins() -> Iterator[dict]:
+    """Собрать закрепления, сделанные за запрос, для set_pin_cookie"""
+    pins = {}
+    token = _request_pins.set(pins)
+    try:
+        yield pins
+    finally:
+        _request_pins.reset(token)
+
+
+def set_pin_cookie(response: Response, pins: dict):
+    for user_id, until in pins.items():
+        response.set_cookie(
+            PIN_COOKIE, f"{user_id}.{until}.{_pin_signature(user_id, until)}",
+            max_age=int(settings.READ_YOUR_WRITES_SECONDS) + 1, httponly=True, samesite="lax",
+        )
+
+
+def _cookie_pinned(request: Request, user_id: int) -> bool:
+    try:
+        pinned_user, until, signature = request.cookies.get(PIN_COOKIE, "").split(".")
+        pinned_user, until = int(pinned_user), int(until)
+    except ValueError:
+        return False
+    return (
+        pinned_user == user_id
+        and until > time.time()
+        and hmac.compare_digest(signature, _pin_signature(pinned_user, until))
+    )
+
+
+def mark_replica_down():
+    global _replica_down_until
+    if _replica_down_until <= time.monotonic():
+        logger.warning("Реплика недоступна, чтение идет с основной БД %.0f с", settings.REPLICA_RETRY_SECONDS)
+    _replica_down_until = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+
+def is_replica_session(db: AsyncSession) -> bool:
+    # bind сессии реплики меняется на основную БД, если реплика не ответила
+    return replica_engine is not None and db.sync_session.bind is replica_engine.sync_engine
+
+
+def _token_subject(request: Request) -> Optional[int]:
+    """sub из Bearer-токена без проверки подписи.
+
+    Используется только для выбора БД: поддельный токен в худшем случае
+    отправит запрос на основную БД, а саму авторизацию проверяет auth_service.
+    """
+    header = request.headers.get("authorization", "")
+    scheme, _, token = header.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return int(jwt.get_unverified_claims(token)["sub"])
+    except (JWTError, KeyError, TypeError, ValueError):
+        return None
+
+
+def _read_target(request: Request) -> str:
+    """Причина выбора основной БД или "replica" """
+    if ReplicaSessionLocal is None:
+        return "no_replica"
+    if _replica_down_until > time.monotonic():
+        return "replica_down"
+    user_id = _token_subject(request)
+    if user_id is not None and (_pinned.get(user_id) or _cookie_pinned(request, user_id)):
+        return "read_your_writes"
+    return "replica"
+
+
+@asynccontextmanager
+async def read_session(request: Request):
+    """Сессия только для чтения: реплика, если это безопасно для пользователя запроса.
+
+    Соединение берется при первом запросе, поэтому запрос, которому БД не
+    понадобилась (например, пользователь нашелся в кеше), его не занимает.
+    """
+    reason = _read_target(request)
+    DB_READ_ROUTING.labels("replica" if reason == "replica" else "primary", reason).inc()
+    session = ReplicaSessionLocal() if reason == "replica" else AsyncSessionLocal()
+    try:
+        yield session
+    finally:
+        await session.close()
+
+
+async def get_read_db(request: Request):
+    """Сессия для эндпоинтов, которые только читают"""
+    async with read_session(request) as session:
+        yield session
+
+
+@event.listens_for(PrimarySession, "do_orm_execute")
+def _track_statement_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(PrimarySession, "after_flush")
+def _track_flush_writes(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(PrimarySession, "after_commit")
+def _pin_writer(session):
+    if session.info.pop("wrote", False):
+        pin_to_primary(current_user_id.get())
+
+
+@event.listens_for(PrimarySession, "after_rollback")
+def _reset_writes(session):
+    session.info.pop("wrote", None)
+
+
+@event.listens_for(ReplicaSession, "after_begin")
+def _replica_fallback(session, transaction, connection):
+    # Сессия реплики начала транзакцию на основной БД: реплика не ответила
+    if connection.engine is not replica_engine.sync_engine:
+        DB_READ_ROUTING.labels("primary", "replica_connect_failed").inc()
+        mark_replica_down()
+
+
+if replica_engine is not None:
+    @event.listens_for(replica_engine.sync_engine, "handle_error")
+    def _replica_error(context):
+        # Обрыв соединения посреди запроса: следующие запросы пойдут на основную БД
+        if context.is_disconnect or isinstance(context.original_exception, OSError):
+            mark_replica_down()
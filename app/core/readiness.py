@@ -0,0 +1,13 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class Readiness:
+    """Состояние процесса для /health/ready"""
+    ready: bool = False
+    shutting_down: bool = False
+    startup_seconds: Optional[float] = None
+
+
+readiness = Readiness()
@@ -0,0 +1,111 @@
+import hashlib
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, Iterable, Optional, Sequence, Tuple
+
+from fastapi import Request, Response, status
+from pydantic import TypeAdapter
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.file_responses import etag_matches
+from app.core.metrics import register_cache
+
+# Ответы зависят от пользователя: промежуточным кешам хранить нельзя,
+# браузеру - только с перепроверкой по ETag
+CACHE_CONTROL = "private, no-cache"
+
+# Список пользователей; строки отдельных пользователей и истории анализов - по id
+USERS_TAG = "users"
+
+
+def user_tag(user_id: int) -> str:
+    return f"user:{user_id}"
+
+
+def results_tag(user_id: int) -> str:
+    return f"results:{user_id}"
+
+
+def make_etag(rows: Iterable, *extra) -> str:
+    """Слабый ETag по id и updated_at строк: меняется при любом изменении строки"""
+    digest = hashlib.sha1()
+    for row in rows:
+        digest.update(f"{row.id}:{row.updated_at.isoformat() if row.updated_at else ''};".encode())
+    for value in extra:
+        digest.update(f"|{value}".encode())
+    return f'W/"{digest.hexdigest()[:20]}"'
+
+
+def to_json(adapter: TypeAdapter, value) -> bytes:
+    """JSON по схеме ответа из ORM-объектов, как это делает response_model"""
+    return adapter.dump_json(adapter.validate_python(value, from_attributes=True))
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    etag: str
+    headers: Dict[str, str]
+
+
+class ResponseCache:
+    """Сериализованные JSON-ответы GET-эндпоинтов с ETag.
+
+    Ключ записи включает номера поколений ее тегов; запись данных
+    увеличивает поколение тега (invalidate), и старые записи перестают
+    находиться, а потом вытесняются LRU. Поколения локальны для процесса,
+    поэтому запись из другого воркера становится видна не позже ttl.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._entries = TTLCache(maxsize, ttl)
+        self._generations: Dict[str, int] = defaultdict(int)
+
+    def invalidate(self, *tags: str):
+        for tag in tags:
+            self._generations[tag] += 1
+
+    def _key(self, request: Request, tags: Sequence[str]) -> tuple:
+        return (
+            request.url.path,
+            request.url.query,
+            tuple((tag, self._generations[tag]) for tag in tags),
+        )
+
+    def _respond(self, request: Request, entry: CachedResponse) -> Response:
+        headers = {"ETag": entry.etag, "Cache-Control": CACHE_CONTROL, "Vary": "Authorization", **entry.headers}
+        if etag_matches(request.headers.get("if-none-match"), entry.etag):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(content=entry.body, media_type="application/json", headers=headers)
+
+    def lookup(self, request: Request, tags: Sequence[str]) -> Tuple[Optional[Response], tuple]:
+        """Ответ из кеша (200 или 304) или None, если его нужно построить, и ключ для store.
+
+        Ключ фиксирует поколения тегов до чтения данных: если invalidate
+        случится между lookup и store, ответ, прочитанный до записи,
+        сохранится под устаревшим ключом и не будет найден.
+        """
+        key = self._key(request, tags)
+        entry = self._entries.get(key)
+        return (None if entry is None else self._respond(request, entry)), key
+
+    def store(
+            self,
+            request: Request,
+            key: tuple,
+            body: bytes,
+            etag: str,
+            headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """Сохранить ответ под ключом, который вернул lookup"""
+        entry = CachedResponse(body, etag, headers or {})
+        self._entries.set(key, entry)
+        return self._respond(request, entry)
+
+    def stats(self) -> dict:
+        return self._entries.stats()
+
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_SIZE, settings.RESPONSE_CACHE_TTL_SECONDS)
+register_cache("responses", response_cache.stats)
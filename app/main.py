@@ -1,11 +1,31 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from prometheus_client import Gauge
+import asyncio
+import logging
 import os
+import re
+import time
+import uuid
 from app.api.router import api_router
-from app.core.db_init import init_database
-from app.core.db import AsyncSessionLocal
-from app.models.user import User
-from sqlalchemy import select, text
+from app.api import health
+from app.core.config import settings
+from app.core.db_init import init_database, reset_database, warm_up_pool
+from app.core.db import engine
+from app.core.base import replica_engine
+from app.core.log import request_id_var, setup_logging, stop_logging
+from app.core.metrics import RequestStats, observe_request, render_metrics, request_stats, server_timing
+from app.core.profiler import finish_profiler, profile_requested, sampled, start_profiler
+from app.core.read_replica import collect_pins, set_pin_cookie
+from app.core.readiness import readiness
+from app.services.analysis_service import inference_engine
+from app.services.job_service import job_workers
+from app.services.password_hasher import password_hasher
+from app.services.session_service import session_purger
+from app.services.similarity_service import load_similarity_index
+
+setup_logging()
+logger = logging.getLogger("app.main")
 
 app = FastAPI(title="AuraStyle API")
 
@@ -19,40 +39,139 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Request-ID"],
 )
 
 app.include_router(api_router, prefix="/api/v1")
+app.include_router(health.router)
+
+Gauge("inference_queue_size", "Requests waiting for inference").set_function(
+    lambda: inference_engine.queue_size
+)
+Gauge("password_hash_pending", "bcrypt jobs queued or running").set_function(
+    lambda: password_hasher.pending
+)
+STARTUP_SECONDS = Gauge("app_startup_seconds", "Time from process startup event to ready")
+
+
+@app.middleware("http")
+async def carry_read_your_writes(request: Request, call_next):
+    """Закрепление за основной БД после записи уходит клиенту в cookie: ее увидят и другие воркеры"""
+    with collect_pins() as pins:
+        response = await call_next(request)
+    set_pin_cookie(response, pins)
+    return response
+
+
+@app.middleware("http")
+async def profile_request(request: Request, call_next):
+    """Сэмплирующий профиль запроса по заголовку X-Profile или случайной выборке"""
+    requested = profile_requested(request.headers)
+    profiler = start_profiler() if requested or sampled() else None
+    if profiler is None:
+        return await call_next(request)
+    try:
+        response = await call_next(request)
+    finally:
+        # id запроса приходит из заголовка - в имени файла оставляем только безопасные символы
+        name = re.sub(r"[^\w-]", "_", request_id_var.get() or uuid.uuid4().hex)
+        filename = await asyncio.to_thread(finish_profiler, profiler, name)
+    if requested:
+        # Имя файла на сервере - только тому, кто предъявил PROFILE_TOKEN
+        response.headers["X-Profile-File"] = filename
+    return response
+
+
+@app.middleware("http")
+async def track_request_metrics(request: Request, call_next):
+    """Время запроса, статистика SQL по каждому маршруту и заголовок Server-Timing"""
+    stats = RequestStats()
+    token = request_stats.set(stats)
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        if settings.SERVER_TIMING_ENABLED:
+            response.headers["Server-Timing"] = server_timing(stats, time.perf_counter() - start)
+        return response
+    finally:
+        route = request.scope.get("route")
+        observe_request(
+            request.method,
+            route.path if route is not None else "unmatched",
+            status_code,
+            time.perf_counter() - start,
+            stats,
+        )
+        request_stats.reset(token)
+
+
+@app.middleware("http")
+async def assign_request_id(request: Request, call_next):
+    """id запроса для корреляции логов: из заголовка X-Request-ID или новый"""
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token = request_id_var.set(request_id[:64])
+    try:
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id_var.get()
+        return response
+    finally:
+        request_id_var.reset(token)
 
 
 @app.on_event("startup")
 async def startup_event():
+    startup_started = time.perf_counter()
+    setup_logging()
     # Проверяем флаг RESET_DATABASE
     reset_db = os.getenv("RESET_DATABASE", "false").lower() == "true"
 
     if reset_db:
-        print("🔄 Пересоздание БД...")
-        # Удаляем и пересоздаем таблицы
-        async with AsyncSessionLocal() as session:
-            try:
-                # Удаляем все таблицы
-                await session.execute(text("DROP TABLE IF EXISTS results CASCADE"))
-                await session.execute(text("DROP TABLE IF EXISTS images CASCADE"))
-                await session.execute(text("DROP TABLE IF EXISTS sessions CASCADE"))
-                await session.execute(text("DROP TABLE IF EXISTS users CASCADE"))
-                await session.commit()
-                print("✅ Старые таблицы удалены")
-            except Exception as e:
-                print(f"⚠️ Ошибка при удалении таблиц: {e}")
-                await session.rollback()
-
-    await init_database()
-    print("✅ AuraStyle backend запущен!")
-
-    # Проверка что БД работает
-    async with AsyncSessionLocal() as session:
-        result = await session.execute(select(User))
-        users = result.scalars().all()
-        print(f"✅ База данных подключена. Пользователей в БД: {len(users)}")
+        logger.info("Пересоздание БД...")
+        await reset_database()
+    elif settings.DB_AUTO_CREATE:
+        await init_database()
+
+    # Прогрев: соединения пула и модель в каждом воркере инференса
+    await warm_up_pool()
+    await inference_engine.start()
+    await inference_engine.warmup()
+    await job_workers.start()
+    await session_purger.start()
+    await load_similarity_index()
+
+    readiness.startup_seconds = time.perf_counter() - startup_started
+    STARTUP_SECONDS.set(readiness.startup_seconds)
+    if readiness.startup_seconds > settings.STARTUP_BUDGET_SECONDS:
+        logger.warning(
+            "Старт занял %.2f с, бюджет %.2f с",
+            readiness.startup_seconds, settings.STARTUP_BUDGET_SECONDS,
+        )
+    readiness.ready = True
+    logger.info("AuraStyle backend запущен за %.2f с", readiness.startup_seconds)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Балансировщик перестает слать трафик, пока дорабатывают текущие запросы
+    readiness.ready = False
+    readiness.shutting_down = True
+    await session_purger.stop()
+    await job_workers.stop()
+    await inference_engine.stop()
+    password_hasher.shutdown()
+    await engine.dispose()
+    if replica_engine is not None:
+        await replica_engine.dispose()
+    stop_logging()
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 
 @app.get("/")
 async def root():
@@ -0,0 +1,120 @@
+"""Извлечение доминирующих цветов изображения"""
+from typing import List, Tuple
+
+import numpy as np
+
+# Именованная палитра: центроиды кластеров сопоставляются с ближайшим цветом
+NAMED_COLORS = {
+    "black": (20, 20, 20),
+    "white": (245, 245, 245),
+    "gray": (128, 128, 128),
+    "silver": (192, 192, 192),
+    "red": (200, 30, 40),
+    "maroon": (120, 20, 30),
+    "orange": (240, 130, 30),
+    "yellow": (240, 215, 50),
+    "beige": (225, 205, 170),
+    "brown": (120, 75, 40),
+    "olive": (120, 120, 40),
+    "green": (40, 150, 60),
+    "teal": (20, 128, 128),
+    "navy": (25, 35, 90),
+    "blue": (40, 90, 200),
+    "light blue": (150, 200, 235),
+    "purple": (110, 50, 150),
+    "pink": (240, 150, 180),
+}
+
+COLOR_NAMES = list(NAMED_COLORS)
+_PALETTE = np.array(list(NAMED_COLORS.values()), dtype=np.float32)
+
+# Таблица поиска: RGB, квантованный до 5 бит на канал -> индекс имени цвета.
+# 32^3 ячеек считаются один раз при импорте, дальше имя цвета - это одно обращение
+_LUT_SHIFT = 3
+
+
+def _build_lut() -> np.ndarray:
+    levels = (np.arange(256 >> _LUT_SHIFT) << _LUT_SHIFT) + (1 << (_LUT_SHIFT - 1))
+    grid = np.stack(np.meshgrid(levels, levels, levels, indexing="ij"), axis=-1)
+    grid = grid.reshape(-1, 3).astype(np.float32)
+    distances = ((grid[:, None, :] - _PALETTE[None, :, :]) ** 2).sum(axis=-1)
+    return distances.argmin(axis=1).astype(np.uint8)
+
+
+_LUT = _build_lut()
+
+
+def color_names(rgb: np.ndarray) -> List[str]:
+    """Имена ближайших цветов палитры для массива (N, 3)"""
+    q = np.clip(rgb, 0, 255).astype(np.int64) >> _LUT_SHIFT
+    bits = 8 - _LUT_SHIFT
+    index = (q[:, 0] << (2 * bits)) | (q[:, 1] << bits) | q[:, 2]
+    return [COLOR_NAMES[i] for i in _LUT[index]]
+
+
+def sample_pixels(image: np.ndarray, max_pixels: int = 4096) -> np.ndarray:
+    """Равномерная выборка пикселей (H, W, 3) -> (N, 3) float32 без ресайза"""
+    h, w = image.shape[:2]
+    step = max(1, int(np.ceil(np.sqrt(h * w / max_pixels))))
+    return image[::step, ::step, :3].reshape(-1, 3).astype(np.float32)
+
+
+def kmeans(points: np.ndarray, k: int, iterations: int = 10, tol: float = 0.5) -> Tuple[np.ndarray, np.ndarray]:
+    """Векторизованный k-means. Возвращает центроиды (k, D) и размеры кластеров.
+
+    Инициализация детерминированная: точки, равномерно взятые по
+    отсортированной яркости, поэтому одинаковые входы дают одинаковый ответ.
+    tol - сдвиг центроидов, при котором итерации останавливаются (для пикселей 0-255).
+    """
+    n = len(points)
+    k = min(k, n)
+    order = np.argsort(points.sum(axis=1), kind="stable")
+    centroids = points[order[np.linspace(0, n - 1, k).astype(np.int64)]].copy()
+
+    sq_points = (points ** 2).sum(axis=1)[:, None]
+    counts = np.zeros(k, dtype=np.int64)
+    for _ in range(iterations):
+        # |p - c|^2 = |p|^2 - 2 p.c + |c|^2, без промежуточного тензора (N, k, D)
+        distances = sq_points - 2 * points @ centroids.T + (centroids ** 2).sum(axis=1)[None, :]
+        labels = distances.argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+
+        sums = np.stack(
+            [np.bincount(labels, weights=points[:, d], minlength=k) for d in range(points.shape[1])],
+            axis=1,
+        )
+        nonempty = counts > 0
+        updated = centroids.copy()
+        updated[nonempty] = sums[nonempty] / counts[nonempty, None]
+        if np.allclose(updated, centroids, atol=tol):
+            centroids = updated
+            break
+        centroids = updated
+
+    return centroids, counts
+
+
+def extract_dominant_colors(
+        image: np.ndarray,
+        top: int = 3,
+        clusters: int = 5,
+        max_pixels: int = 4096,
+) -> List[str]:
+    """Названия top доминирующих цветов изображения (H, W, 3) uint8"""
+    pixels = sample_pixels(image, max_pixels)
+    if len(pixels) == 0:
+        return []
+
+    centroids, counts = kmeans(pixels, clusters)
+    order = np.argsort(counts)[::-1]
+    names = color_names(centroids[order])
+
+    result = []
+    for name, count in zip(names, counts[order]):
+        # Несколько кластеров могут попасть в один именованный цвет
+        if count == 0 or name in result:
+            continue
+        result.append(name)
+        if len(result) == top:
+            break
+    return result
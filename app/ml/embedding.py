@@ -0,0 +1,37 @@
+"""Компактный вектор изображения для поиска похожих образов"""
+from typing import Dict
+
+import numpy as np
+
+from app.ml.ml import STYLES
+
+# Совместная гистограмма RGB: HIST_BINS^3 ячеек
+HIST_BINS = 3
+# Доля стилевой части в косинусной близости
+STYLE_WEIGHT = 0.3
+EMBEDDING_DIM = HIST_BINS ** 3 + len(STYLES)
+
+
+def color_histogram(image: np.ndarray) -> np.ndarray:
+    """Нормированная гистограмма цветов (H, W, 3) uint8 -> (HIST_BINS^3,)"""
+    quantized = (image[..., :3].reshape(-1, 3).astype(np.uint16) * HIST_BINS) >> 8
+    index = (quantized[:, 0] * HIST_BINS + quantized[:, 1]) * HIST_BINS + quantized[:, 2]
+    hist = np.bincount(index, minlength=HIST_BINS ** 3).astype(np.float32)
+    return hist / max(hist.sum(), 1.0)
+
+
+def build_embedding(image: np.ndarray, scores: Dict[str, float]) -> np.ndarray:
+    """Вектор единичной длины: близость векторов - скалярное произведение.
+
+    Корень из гистограммы (расстояние Хеллингера) уже имеет единичную норму,
+    стилевые вероятности нормируем отдельно и смешиваем с весом STYLE_WEIGHT.
+    """
+    colors = np.sqrt(color_histogram(image))
+    style = np.array([scores.get(name, 0.0) for name in STYLES], dtype=np.float32)
+    norm = np.linalg.norm(style)
+    if norm > 0:
+        style /= norm
+    return np.concatenate([
+        colors * np.sqrt(1 - STYLE_WEIGHT),
+        style * np.sqrt(STYLE_WEIGHT),
+    ]).astype(np.float32)
@@ -1 +1,228 @@
-"директория для нашей ai модели"
\ No newline at end of file
+"директория для нашей ai модели"
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional
+
+import numpy as np
+
+from app.ml.preprocess import INPUT_SIZE
+
+STYLES = ["casual", "sport", "classic", "business", "street", "evening"]
+
+RECOMMENDATIONS = {
+    "casual": ["Great for everyday wear", "Try adding a statement accessory"],
+    "sport": ["Comfortable for active days", "Pair with clean sneakers"],
+    "classic": ["Timeless look", "Works well with neutral colors"],
+    "business": ["Suitable for the office", "Add a structured bag"],
+    "street": ["Bold urban look", "Layering works well here"],
+    "evening": ["Good choice for an evening out", "Minimal jewelry keeps it elegant"],
+}
+
+
+class StubStyleModel:
+    """Детерминированная CPU-заглушка вместо настоящей модели.
+
+    Ответ зависит только от пикселей, поэтому одно и то же изображение
+    всегда получает один и тот же результат. Интерфейс совпадает с тем,
+    что ожидается от настоящей модели: батч (N, H, W, 3) uint8 на входе,
+    список словарей на выходе.
+    """
+
+    version = "stub-v1"
+
+    def __init__(self, seed: int = 42):
+        rng = np.random.default_rng(seed)
+        # Признаки: среднее и стандартное отклонение по каналам RGB
+        self.weights = rng.normal(size=(6, len(STYLES))).astype(np.float32)
+
+    def predict(self, batch: np.ndarray) -> List[dict]:
+        x = batch.astype(np.float32) / 255.0
+        features = np.concatenate([x.mean(axis=(1, 2)), x.std(axis=(1, 2))], axis=1)
+        logits = (features - 0.5) @ self.weights * 4.0
+        logits -= logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+
+        outputs = []
+        for row in probs:
+            style = STYLES[int(row.argmax())]
+            outputs.append({
+                "style": style,
+                "confidence": round(float(row.max()), 4),
+                "scores": {name: round(float(p), 4) for name, p in zip(STYLES, row)},
+                "recommendations": RECOMMENDATIONS[style],
+            })
+        return outputs
+
+
+def load_model():
+    # Когда появится настоящая модель, ее загрузка будет здесь
+    return StubStyleModel()
+
+
+# Модель в процессе-воркере пула: загружается один раз при старте процесса
+_worker_model = None
+
+
+def _init_worker():
+    global _worker_model
+    _worker_model = load_model()
+
+
+def _predict_batch(batch: np.ndarray) -> List[dict]:
+    if _worker_model is None:
+        _init_worker()
+    return _worker_model.predict(batch)
+
+
+class EngineOverloaded(Exception):
+    """Очередь инференса заполнена"""
+
+
+@dataclass
+class _PendingRequest:
+    array: np.ndarray
+    future: asyncio.Future
+
+
+class InferenceEngine:
+    """Собирает одновременные запросы в батчи и выполняет их в пуле процессов.
+
+    Батч отправляется, когда набралось max_batch_size запросов или
+    прошло max_wait_ms с момента первого. Одновременно выполняется не
+    больше workers батчей; пока все заняты, запросы копятся в очереди,
+    а при ее переполнении predict() сразу бросает EngineOverloaded.
+    """
+
+    def __init__(
+            self,
+            max_batch_size: int = 16,
+            max_wait_ms: float = 10,
+            max_queue: int = 256,
+            workers: int = 2,
+            timeout: float = 10.0,
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_queue = max_queue
+        self.workers = workers
+        self.timeout = timeout
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._collector: Optional[asyncio.Task] = None
+        self._batches: set = set()
+
+    @property
+    def running(self) -> bool:
+        return self._collector is not None and not self._collector.done()
+
+    @property
+    def queue_size(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def start(self):
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        # workers=0 - инференс в пуле потоков текущего процесса (удобно для разработки)
+        if self.workers > 0:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+            )
+        self._slots = asyncio.Semaphore(max(self.workers, 1))
+        self._collector = asyncio.create_task(self._collect())
+
+    async def stop(self):
+        if self._collector is not None:
+            self._collector.cancel()
+            try:
+                await self._collector
+            except asyncio.CancelledError:
+                pass
+            self._collector = None
+
+        if self._batches:
+            await asyncio.gather(*self._batches, return_exceptions=True)
+
+        # Запросы, не попавшие в батч, завершаем ошибкой
+        while self._queue is not None and not self._queue.empty():
+            request = self._queue.get_nowait()
+            if not request.future.done():
+                request.future.set_exception(EngineOverloaded("Inference engine stopped"))
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def warmup(self):
+        """Прогнать пустой батч в каждом воркере до приема трафика.
+
+        Пул процессов запускает воркеры лениво, поэтому без прогрева первые
+        запросы платят за старт процесса и загрузку модели.
+        """
+        if not self.running:
+            raise RuntimeError("Inference engine is not started")
+        dummy = np.zeros((1, INPUT_SIZE[1], INPUT_SIZE[0], 3), dtype=np.uint8)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(
+            loop.run_in_executor(self._executor, _predict_batch, dummy)
+            for _ in range(max(self.workers, 1))
+        ))
+
+    async def predict(self, array: np.ndarray) -> dict:
+        """Поставить изображение в очередь и дождаться результата"""
+        if not self.running:
+            raise RuntimeError("Inference engine is not started")
+
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait(_PendingRequest(array, future))
+        except asyncio.QueueFull:
+            raise EngineOverloaded("Inference queue is full")
+
+        # При таймауте future отменяется, и батч пропустит этот запрос
+        return await asyncio.wait_for(future, self.timeout)
+
+    async def _collect(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            # Запросы, которые уже истекли по таймауту, не считаем
+            batch = [request for request in batch if not request.future.done()]
+            if not batch:
+                continue
+
+            await self._slots.acquire()
+            task = asyncio.create_task(self._run_batch(batch))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[_PendingRequest]):
+        try:
+            arrays = np.stack([request.array for request in batch])
+            loop = asyncio.get_running_loop()
+            outputs = await loop.run_in_executor(self._executor, _predict_batch, arrays)
+            for request, output in zip(batch, outputs):
+                if not request.future.done():
+                    request.future.set_result(output)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        finally:
+            self._slots.release()
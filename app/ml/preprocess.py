@@ -0,0 +1,146 @@
+"""Предобработка изображений и хранилище готовых входов модели.
+
+Конвейер: декодирование -> поворот по EXIF -> RGB -> размер входа модели ->
+uint8 (H, W, 3). Перевод в float делает сама модель, поэтому хранится
+uint8: вчетверо меньше места.
+
+TensorStore складывает результаты в чанки .npy и читает их через memmap,
+так что повторный анализ (новая версия модели, бэкфилл) получает срез
+массива без копирования вместо повторного декодирования оригинала.
+"""
+import fcntl
+import os
+import threading
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image as PILImage, ImageOps
+
+# Размер входа модели (ширина, высота)
+INPUT_SIZE = (224, 224)
+INPUT_SHAPE = (INPUT_SIZE[1], INPUT_SIZE[0], 3)
+
+
+def load_image_array(source) -> np.ndarray:
+    """Декодировать изображение (путь или файл) и привести его к входу модели (H, W, 3) uint8"""
+    with PILImage.open(source) as img:
+        # Для JPEG декодируем сразу в уменьшенном масштабе
+        img.draft("RGB", (INPUT_SIZE[0] * 2, INPUT_SIZE[1] * 2))
+        # Снимки с телефона часто хранятся повернутыми, а ориентация - в EXIF
+        img = ImageOps.exif_transpose(img)
+        img = img.convert("RGB").resize(INPUT_SIZE, PILImage.BILINEAR)
+        return np.asarray(img, dtype=np.uint8)
+
+
+class TensorStore:
+    """Массивы одинаковой формы по ключу SHA-256, в чанках .npy на диске.
+
+    chunk_NNNNN.npy - массив (chunk_size, *shape), открываемый через memmap;
+    index.bin - 32-байтные ключи в порядке слотов (запись i описывает слот i).
+    Слот сначала заполняется, и только потом его ключ дописывается в индекс,
+    поэтому читатель не увидит ключ незаписанного слота. Запись из нескольких
+    процессов сериализуется flock на файле индекса, новые ключи других
+    процессов подхватываются при промахе.
+    """
+
+    KEY_SIZE = 32
+
+    def __init__(self, directory: str, shape: Tuple[int, ...], dtype=np.uint8, chunk_size: int = 1024):
+        self.directory = directory
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.chunk_size = chunk_size
+        self.index_path = os.path.join(directory, "index.bin")
+
+        self._slots: Dict[bytes, int] = {}
+        self._count = 0
+        self._chunks: Dict[int, np.memmap] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    def _chunk_path(self, number: int) -> str:
+        return os.path.join(self.directory, f"chunk_{number:05d}.npy")
+
+    def _chunk(self, number: int) -> np.memmap:
+        chunk = self._chunks.get(number)
+        if chunk is None:
+            path = self._chunk_path(number)
+            if not os.path.exists(path):
+                # Файл разреженный: место занимают только заполненные слоты
+                np.lib.format.open_memmap(
+                    path, mode="w+", dtype=self.dtype, shape=(self.chunk_size, *self.shape)
+                ).flush()
+            chunk = np.lib.format.open_memmap(path, mode="r+")
+            if chunk.shape[1:] != self.shape or chunk.dtype != self.dtype:
+                raise ValueError(f"{path} holds {chunk.dtype}{chunk.shape[1:]}, expected {self.dtype}{self.shape}")
+            self._chunks[number] = chunk
+        return chunk
+
+    def _refresh(self):
+        try:
+            size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return
+        total = size // self.KEY_SIZE
+        if total <= self._count:
+            return
+        keys = np.fromfile(
+            self.index_path, dtype=np.uint8,
+            count=(total - self._count) * self.KEY_SIZE,
+            offset=self._count * self.KEY_SIZE,
+        ).reshape(-1, self.KEY_SIZE)
+        for offset, key in enumerate(keys):
+            self._slots.setdefault(key.tobytes(), self._count + offset)
+        self._count = total
+
+    def refresh(self):
+        """Подхватить ключи, записанные другими процессами"""
+        with self._lock:
+            self._refresh()
+
+    def _slot(self, key: bytes) -> Optional[int]:
+        slot = self._slots.get(key)
+        if slot is None:
+            self._refresh()
+            slot = self._slots.get(key)
+        return slot
+
+    def get(self, content_hash: str) -> Optional[np.ndarray]:
+        """Массив по ключу (только для чтения, без копирования) или None"""
+        key = bytes.fromhex(content_hash)
+        with self._lock:
+            slot = self._slot(key)
+            if slot is None:
+                return None
+            view = self._chunk(slot // self.chunk_size)[slot % self.chunk_size]
+        view.flags.writeable = False
+        return view
+
+    def put(self, content_hash: str, array: np.ndarray):
+        """Сохранить массив, если ключа еще нет"""
+        key = bytes.fromhex(content_hash)
+        if array.shape != self.shape:
+            raise ValueError(f"Expected shape {self.shape}, got {array.shape}")
+        with self._lock:
+            if self._slot(key) is not None:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.index_path, "ab") as index:
+                fcntl.flock(index, fcntl.LOCK_EX)
+                try:
+                    # Пока ждали блокировку, другой процесс мог занять слоты или записать этот ключ
+                    self._refresh()
+                    if key in self._slots:
+                        return
+                    slot = self._count
+                    chunk = self._chunk(slot // self.chunk_size)
+                    chunk[slot % self.chunk_size] = array
+                    chunk.flush()
+                    index.write(key)
+                    index.flush()
+                    self._slots[key] = slot
+                    self._count += 1
+                finally:
+                    fcntl.flock(index, fcntl.LOCK_UN)
@@ -0,0 +1,257 @@
+"""Индекс векторов изображений для поиска похожих образов.
+
+Векторы хранятся в файле записей фиксированного размера, который только
+дописывается. Индекс читает файл через np.memmap и догружает новые записи
+по мере роста файла, поэтому несколько процессов, пишущих в один файл,
+видят записи друг друга без обращения к БД.
+
+Поиск - скалярное произведение (векторы единичной длины). По записям
+одного пользователя и по небольшому индексу - полный перебор; когда
+записей больше ivf_threshold, глобальный поиск идет по IVF: векторы
+разбиты k-means на nlist кластеров, а запрос просматривает только nprobe
+ближайших кластеров.
+"""
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.ml.colors import kmeans
+
+# Сколько векторов брать для обучения центроидов и по сколько раскладывать за раз
+TRAIN_SAMPLE = 16384
+ASSIGN_CHUNK = 16384
+
+
+def record_dtype(dim: int) -> np.dtype:
+    return np.dtype([
+        ("result_id", "<i8"),
+        ("user_id", "<i8"),
+        ("content_key", "<u8"),
+        ("vector", "<f4", (dim,)),
+    ])
+
+
+def content_key(content_hash: Optional[str]) -> int:
+    """Первые 8 байт SHA-256 содержимого: одинаковые изображения получают один вектор"""
+    return int(content_hash[:16], 16) if content_hash else 0
+
+
+@dataclass
+class IVFState:
+    centroids: np.ndarray  # (nlist, dim)
+    order: np.ndarray  # строки, отсортированные по кластеру
+    offsets: np.ndarray  # (nlist + 1,) границы кластеров в order
+    trained_count: int  # строки >= trained_count разложены по кластерам в _assign
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # Для векторов единичной длины ближайший центроид - с наибольшим
+    # v.c - |c|^2 / 2 (эквивалент минимума |v - c|^2)
+    half_norms = (centroids ** 2).sum(axis=1) / 2
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = vectors[start:start + ASSIGN_CHUNK]
+        labels[start:start + len(chunk)] = (chunk @ centroids.T - half_norms).argmax(axis=1)
+    return labels
+
+
+class VectorIndex:
+    """Догрузка, запись и поиск идут под общей блокировкой, поэтому их можно
+    вызывать из пула потоков; train() работает без нее по снимку первых строк
+    """
+
+    def __init__(self, path: str, dim: int, ivf_threshold: int = 50_000, nprobe: int = 16):
+        self.path = path
+        self.dim = dim
+        self.dtype = record_dtype(dim)
+        self.ivf_threshold = ivf_threshold
+        self.nprobe = nprobe
+
+        self._count = 0
+        self._result_ids = np.empty(0, dtype=np.int64)
+        self._vectors = np.empty((0, dim), dtype=np.float32)
+        self._assign = np.empty(0, dtype=np.int32)
+        self._row_by_result: Dict[int, int] = {}
+        self._row_by_key: Dict[int, int] = {}
+        self._user_rows: Dict[int, List[int]] = {}
+        self._ivf: Optional[IVFState] = None
+        # Реентерабельная: append догружает запись через refresh
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def ivf_trained(self) -> bool:
+        return self._ivf is not None
+
+    def _grow(self, needed: int):
+        capacity = len(self._result_ids)
+        if needed <= capacity:
+            return
+        capacity = max(needed, capacity * 2, 1024)
+        for name in ("_result_ids", "_assign"):
+            old = getattr(self, name)
+            grown = np.empty(capacity, dtype=old.dtype)
+            grown[:self._count] = old[:self._count]
+            setattr(self, name, grown)
+        vectors = np.empty((capacity, self.dim), dtype=np.float32)
+        vectors[:self._count] = self._vectors[:self._count]
+        self._vectors = vectors
+
+    def refresh(self) -> int:
+        """Догрузить записи, дописанные в файл после прошлой загрузки. Возвращает их число"""
+        with self._lock:
+            return self._refresh()
+
+    def _refresh(self) -> int:
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+        # Недописанный хвост (запись другого процесса в процессе) пропускаем до следующего раза
+        total = size // self.dtype.itemsize
+        new = total - self._count
+        if new <= 0:
+            return 0
+
+        records = np.memmap(
+            self.path, dtype=self.dtype, mode="r",
+            offset=self._count * self.dtype.itemsize, shape=(new,),
+        )
+        start = self._count
+        self._grow(start + new)
+        self._result_ids[start:start + new] = records["result_id"]
+        self._vectors[start:start + new] = records["vector"]
+        if self._ivf is not None:
+            self._assign[start:start + new] = _nearest(self._vectors[start:start + new], self._ivf.centroids)
+
+        for offset, (result_id, user_id, key) in enumerate(zip(
+                records["result_id"].tolist(), records["user_id"].tolist(), records["content_key"].tolist()
+        )):
+            row = start + offset
+            self._row_by_result[result_id] = row
+            self._user_rows.setdefault(user_id, []).append(row)
+            if key:
+                self._row_by_key.setdefault(key, row)
+        del records
+
+        self._count = start + new
+        return new
+
+    def append(self, result_id: int, user_id: int, key: int, vector: np.ndarray):
+        """Дописать запись в файл (одной операцией write) и догрузить ее в индекс"""
+        record = np.zeros(1, dtype=self.dtype)
+        record["result_id"] = result_id
+        record["user_id"] = user_id
+        record["content_key"] = key
+        record["vector"] = vector
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            # O_APPEND: записи разных процессов не перемешиваются
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, record.tobytes())
+            finally:
+                os.close(fd)
+            self._refresh()
+
+    def has_result(self, result_id: int) -> bool:
+        return result_id in self._row_by_result
+
+    def vector_for_result(self, result_id: int) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._row_by_result.get(result_id)
+            return None if row is None else self._vectors[row].copy()
+
+    def vector_for_key(self, key: int) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._row_by_key.get(key) if key else None
+            return None if row is None else self._vectors[row].copy()
+
+    def needs_training(self) -> bool:
+        if self._count < self.ivf_threshold:
+            return False
+        # Переобучаем, когда индекс вырос вдвое с прошлого обучения
+        return self._ivf is None or self._count >= 2 * self._ivf.trained_count
+
+    def train(self) -> IVFState:
+        """Обучить центроиды и разложить текущие векторы. Можно вызывать из потока"""
+        count = self._count
+        vectors = self._vectors[:count]
+        nlist = int(min(1024, max(16, np.sqrt(count))))
+
+        rng = np.random.default_rng(0)
+        sample = vectors[rng.choice(count, size=min(count, TRAIN_SAMPLE), replace=False)]
+        centroids, _ = kmeans(sample, nlist, iterations=10, tol=1e-4)
+        centroids = centroids.astype(np.float32)
+
+        labels = _nearest(vectors, centroids)
+        order = np.argsort(labels, kind="stable").astype(np.int64)
+        offsets = np.searchsorted(labels[order], np.arange(len(centroids) + 1)).astype(np.int64)
+        return IVFState(centroids, order, offsets, count)
+
+    def install(self, state: IVFState):
+        """Подключить обученный IVF и разложить строки, добавленные во время обучения"""
+        with self._lock:
+            start = state.trained_count
+            self._assign[start:self._count] = _nearest(self._vectors[start:self._count], state.centroids)
+            self._ivf = state
+
+    def _ivf_candidates(self, query: np.ndarray) -> np.ndarray:
+        ivf = self._ivf
+        probes = np.argsort(ivf.centroids @ query)[::-1][:self.nprobe]
+        parts = [ivf.order[ivf.offsets[p]:ivf.offsets[p + 1]] for p in probes]
+        tail = np.arange(ivf.trained_count, self._count)
+        parts.append(tail[np.isin(self._assign[ivf.trained_count:self._count], probes)])
+        return np.concatenate(parts)
+
+    def search(
+            self,
+            query: np.ndarray,
+            k: int,
+            user_id: Optional[int] = None,
+            exclude_result: Optional[int] = None,
+    ) -> List[Tuple[int, float]]:
+        """k ближайших записей: [(result_id, близость)] по убыванию близости"""
+        with self._lock:
+            return self._search(query, k, user_id, exclude_result)
+
+    def _search(
+            self,
+            query: np.ndarray,
+            k: int,
+            user_id: Optional[int],
+            exclude_result: Optional[int],
+    ) -> List[Tuple[int, float]]:
+        if user_id is not None:
+            rows = np.array(self._user_rows.get(user_id, []), dtype=np.int64)
+        elif self._ivf is not None:
+            rows = self._ivf_candidates(query)
+        else:
+            rows = None
+
+        if rows is None:
+            scores = self._vectors[:self._count] @ query
+            result_ids = self._result_ids[:self._count]
+        else:
+            scores = self._vectors[rows] @ query
+            result_ids = self._result_ids[rows]
+
+        if exclude_result is not None:
+            scores = np.where(result_ids == exclude_result, -np.inf, scores)
+
+        k = min(k, len(scores))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            (int(result_ids[i]), float(scores[i]))
+            for i in top if np.isfinite(scores[i])
+        ]
@@ -2,5 +2,7 @@ from .user import User
 from .image import Image
 from .result import Result
 from .session import Session
+from .job import AnalysisJob
+from .summary import StyleSummary
 
-__all__ = ["User", "Image", "Result", "Session"]
\ No newline at end of file
+__all__ = ["User", "Image", "Result", "Session", "AnalysisJob", "StyleSummary"]
\ No newline at end of file
@@ -8,6 +8,11 @@ class Image(BaseModel):
 
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     image_path = Column(String(255), nullable=False)
+    filename = Column(String(255), nullable=True)  # исходное имя файла
+    content_type = Column(String(100), nullable=True)
+    file_size = Column(Integer, nullable=True)  # в байтах
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 содержимого
 
     user = relationship("User", back_populates="images")
-    result = relationship("Result", back_populates="image", uselist=False)
\ No newline at end of file
+    # По результату на каждую версию модели, которой анализировалось изображение
+    results = relationship("Result", back_populates="image")
\ No newline at end of file
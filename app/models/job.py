@@ -0,0 +1,26 @@
+from sqlalchemy import Column, String, Integer, ForeignKey, Index
+from sqlalchemy.orm import relationship
+from app.core.base import BaseModel
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+
+class AnalysisJob(BaseModel):
+    __tablename__ = "analysis_jobs"
+
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    image_id = Column(Integer, ForeignKey("images.id"), nullable=False)
+    result_id = Column(Integer, ForeignKey("results.id"), nullable=True)
+    status = Column(String(20), nullable=False, default=JOB_PENDING)
+    attempts = Column(Integer, nullable=False, default=0)
+    error = Column(String(255), nullable=True)
+
+    image = relationship("Image")
+
+    __table_args__ = (
+        # Воркеры забирают самые старые задачи в статусе pending
+        Index("ix_analysis_jobs_status_id", "status", "id"),
+    )
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, Float
+from sqlalchemy import Column, String, Integer, ForeignKey, Float, JSON, Index
 from sqlalchemy.orm import relationship
 from app.core.base import BaseModel
 
@@ -7,8 +7,23 @@ class Result(BaseModel):
     __tablename__ = "results"
 
     image_id = Column(Integer, ForeignKey("images.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     style_type = Column(String(100))  # спортивный, кэжуал и тд
     confidence_score = Column(Float)  # уровень уверенности 0-100
     dominant_colors = Column(String(255))  # JSON как строка
+    analysis_data = Column(JSON)  # полный ответ модели
+    content_hash = Column(String(64))  # SHA-256 изображения, для дедупликации
+    model_version = Column(String(50))
 
-    image = relationship("Image", back_populates="result")
\ No newline at end of file
+    image = relationship("Image", back_populates="results")
+
+    __table_args__ = (
+        # Поиск готового анализа для повторно загруженного изображения
+        Index("ix_results_content_hash_model_version", "content_hash", "model_version"),
+        # Один результат на изображение и версию модели: бэкфилл новой версии делает upsert
+        Index("ix_results_image_id_model_version", "image_id", "model_version", unique=True),
+    )
+
+
+# История пользователя с keyset-пагинацией: WHERE user_id = ? AND (created_at, id) < (?, ?)
+Index("ix_results_user_id_created_at_id", Result.user_id, Result.created_at.desc(), Result.id)
@@ -1,13 +1,15 @@
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey
+from sqlalchemy import Column, String, Integer, ForeignKey
 from sqlalchemy.orm import relationship
-from app.core.base import BaseModel
+from app.core.base import BaseModel, Timestamp
 
 
 class Session(BaseModel):
+    """Refresh-сессия пользователя. В token хранится SHA-256 refresh-токена, не сам токен"""
     __tablename__ = "sessions"
 
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    token = Column(String(255), nullable=False, index=True)
-    expires_at = Column(DateTime, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    token = Column(String(255), nullable=False, unique=True, index=True)
+    # Индекс нужен фоновой очистке просроченных сессий
+    expires_at = Column(Timestamp, nullable=False, index=True)
 
-    user = relationship("User", back_populates="sessions")
\ No newline at end of file
+    user = relationship("User", back_populates="sessions")
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, ForeignKey, Float, JSON
+from app.core.base import BaseModel
+
+
+class StyleSummary(BaseModel):
+    """Стилевой профиль пользователя: агрегаты по его results.
+
+    Обновляется в той же транзакции, что и вставка Result
+    (app.services.summary_service), поэтому профиль читается одной строкой.
+    """
+    __tablename__ = "style_summaries"
+
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, unique=True, index=True)
+    total_results = Column(Integer, nullable=False, default=0)
+    confidence_sum = Column(Float, nullable=False, default=0.0)
+    confidence_count = Column(Integer, nullable=False, default=0)
+    style_counts = Column(JSON, nullable=False, default=dict)  # {"casual": 3, ...}
+    color_counts = Column(JSON, nullable=False, default=dict)  # {"black": 5, ...}
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String
+from sqlalchemy import Column, String, Index
 from sqlalchemy.orm import relationship
 from app.core.base import BaseModel
 
@@ -12,4 +12,7 @@ class User(BaseModel):
     avatar_url = Column(String(255), nullable=True)
 
     sessions = relationship("Session", back_populates="user")
-    images = relationship("Image", back_populates="user")
\ No newline at end of file
+    images = relationship("Image", back_populates="user")
+
+# Keyset-пагинация списка пользователей по (created_at, id)
+Index("ix_users_created_at_id", User.created_at, User.id)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
 from datetime import datetime
 
 class AnalysisResponse(BaseModel):
@@ -8,6 +8,18 @@ class AnalysisResponse(BaseModel):
     analysis: Dict[str, Any]
     analyzed_at: datetime
 
+class BatchItemResponse(BaseModel):
+    index: int
+    filename: Optional[str] = None
+    status: str
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    items: List[BatchItemResponse]
+    succeeded: int
+    failed: int
+
 class AnalysisResult(BaseModel):
     style: str
     confidence: float
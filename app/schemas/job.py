@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import Optional
+from datetime import datetime
+
+from app.schemas.analysis import AnalysisResponse
+
+
+class JobResponse(BaseModel):
+    job_id: int
+    status: str
+    image_id: int
+    error: Optional[str] = None
+    result: Optional[AnalysisResponse] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
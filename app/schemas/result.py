@@ -1,6 +1,7 @@
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, field_validator
+from typing import Optional, List, Dict, Any
 from datetime import datetime
+import json
 
 
 class ResultBase(BaseModel):
@@ -8,11 +9,34 @@ class ResultBase(BaseModel):
     confidence_score: Optional[float] = None
     dominant_colors: Optional[List[str]] = None
 
+    @field_validator('dominant_colors', mode='before')
+    def parse_dominant_colors(cls, v):
+        # В БД цвета хранятся JSON-строкой
+        if isinstance(v, str):
+            return json.loads(v) if v else []
+        return v
+
 
 class ResultResponse(ResultBase):
     id: int
     image_id: int
+    model_version: Optional[str] = None
+    analysis_data: Optional[Dict[str, Any]] = None
     created_at: datetime
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+        protected_namespaces = ()
+
+
+class SimilarResult(BaseModel):
+    # id и содержимое - только для собственных результатов пользователя
+    result_id: Optional[int] = None
+    score: float
+    result: Optional[ResultResponse] = None
+
+
+class SimilarResultsResponse(BaseModel):
+    result_id: int
+    scope: str
+    items: List[SimilarResult]
@@ -0,0 +1,15 @@
+from pydantic import BaseModel
+from typing import Dict, List, Optional
+
+
+class TopColor(BaseModel):
+    color: str
+    count: int
+
+
+class StyleSummaryResponse(BaseModel):
+    user_id: int
+    total_results: int = 0
+    average_confidence: Optional[float] = None
+    styles: Dict[str, int] = {}
+    top_colors: List[TopColor] = []
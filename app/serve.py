@@ -0,0 +1,102 @@
+"""Production-запуск: gunicorn с uvicorn-воркерами.
+
+    python -m app.serve
+
+Приложение импортируется в мастере до fork (preload), поэтому воркеры
+стартуют быстрее и делят с мастером страницы памяти с кодом. Каждый воркер
+держит свой пул соединений; его размер урезается так, чтобы все воркеры
+вместе не превысили DB_MAX_CONNECTIONS. По SIGTERM воркеры перестают
+принимать соединения, дорабатывают текущие запросы и выполняют shutdown.
+Для разработки по-прежнему: uvicorn app.main:app --reload
+"""
+import logging
+import os
+from typing import Tuple
+
+from gunicorn.app.base import BaseApplication
+from uvicorn.workers import UvicornWorker
+
+from app.core.config import settings
+from app.core.log import setup_logging
+
+logger = logging.getLogger("app.serve")
+
+# Запас между таймаутом uvicorn и SIGKILL от gunicorn на выполнение shutdown
+SHUTDOWN_MARGIN_SECONDS = 10
+
+
+def available_cpus() -> int:
+    try:
+        # Учитывает ограничение CPU-набора контейнера, в отличие от os.cpu_count()
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def pool_limits(workers: int, pool_size: int, max_overflow: int, max_connections: int) -> Tuple[int, int]:
+    """(pool_size, max_overflow) воркера: workers * (pool_size + max_overflow) <= max_connections"""
+    per_worker = max_connections // workers
+    if per_worker < 1:
+        raise SystemExit(f"DB_MAX_CONNECTIONS={max_connections} is less than the number of workers ({workers})")
+    size = min(pool_size, per_worker)
+    return size, min(max_overflow, per_worker - size)
+
+
+class AppWorker(UvicornWorker):
+    # Без таймаута uvicorn ждал бы долгие соединения до SIGKILL и не успевал выполнить shutdown
+    CONFIG_KWARGS = {
+        "loop": "auto",
+        "http": "auto",
+        "timeout_graceful_shutdown": settings.WEB_GRACEFUL_TIMEOUT_SECONDS,
+    }
+
+
+class Server(BaseApplication):
+    def __init__(self, options: dict):
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        from app.main import app
+        return app
+
+
+def main():
+    setup_logging()
+    workers = settings.WEB_WORKERS or available_cpus()
+    pool_size, max_overflow = pool_limits(
+        workers, settings.DB_POOL_SIZE, settings.DB_MAX_OVERFLOW, settings.DB_MAX_CONNECTIONS
+    )
+    # Движки создаются при импорте app.core.base, то есть при preload - уже с этими размерами
+    settings.DB_POOL_SIZE = pool_size
+    settings.DB_MAX_OVERFLOW = max_overflow
+    logger.info(
+        "Запуск %d воркеров, пул БД на воркер: %d + %d overflow",
+        workers, pool_size, max_overflow,
+    )
+    if workers > 1 and settings.RATE_LIMIT_ENABLED and settings.RATE_LIMIT_BACKEND != "redis":
+        logger.warning(
+            "RATE_LIMIT_BACKEND=%s: у каждого из %d воркеров свои корзины, клиент получает до %d лимитов",
+            settings.RATE_LIMIT_BACKEND, workers, workers,
+        )
+
+    Server({
+        "bind": f"{settings.WEB_HOST}:{settings.WEB_PORT}",
+        "workers": workers,
+        "worker_class": "app.serve.AppWorker",
+        "preload_app": True,
+        "max_requests": settings.WEB_MAX_REQUESTS,
+        "max_requests_jitter": settings.WEB_MAX_REQUESTS_JITTER,
+        "graceful_timeout": settings.WEB_GRACEFUL_TIMEOUT_SECONDS + SHUTDOWN_MARGIN_SECONDS,
+        "timeout": settings.WEB_WORKER_TIMEOUT_SECONDS,
+        # uvicorn подставляет в request.client адрес из X-Forwarded-For только от этих адресов
+        "forwarded_allow_ips": settings.FORWARDED_ALLOW_IPS,
+    }).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+import asyncio
+import json
+import os
+from typing import Dict, Iterable, Optional
+
+from fastapi import HTTPException, status
+from PIL import UnidentifiedImageError
+from sqlalchemy import exists, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import aliased
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.metrics import phase, register_cache
+from app.ml.colors import extract_dominant_colors
+from app.ml.ml import EngineOverloaded, InferenceEngine
+from app.ml.preprocess import INPUT_SHAPE, TensorStore, load_image_array
+from app.models.image import Image
+from app.models.result import Result
+from app.services.storage_service import StoredFile
+
+inference_engine = InferenceEngine(
+    max_batch_size=settings.INFERENCE_MAX_BATCH_SIZE,
+    max_wait_ms=settings.INFERENCE_MAX_WAIT_MS,
+    max_queue=settings.INFERENCE_MAX_QUEUE,
+    workers=settings.INFERENCE_WORKERS,
+    timeout=settings.INFERENCE_TIMEOUT_SECONDS,
+)
+
+# Предобработанные входы модели по SHA-256 содержимого; форма входа - в пути,
+# чтобы смена INPUT_SIZE не смешивала массивы разных размеров
+tensor_store = TensorStore(
+    os.path.join(
+        settings.TENSOR_STORE_DIR or os.path.join(settings.UPLOAD_DIR, "tensors"),
+        "x".join(map(str, INPUT_SHAPE)),
+    ),
+    INPUT_SHAPE,
+    chunk_size=settings.TENSOR_STORE_CHUNK_SIZE,
+) if settings.TENSOR_STORE_ENABLED else None
+
+# Кеш готовых анализов: (content_hash, model_version) -> analysis
+result_cache = TTLCache(settings.RESULT_CACHE_SIZE, settings.RESULT_CACHE_TTL_SECONDS)
+
+# Попадания, найденные уже в БД (после промаха в памяти)
+_db_hits = 0
+
+
+async def find_cached_analysis(
+        db: AsyncSession,
+        content_hash: Optional[str],
+        model_version: str,
+) -> Optional[dict]:
+    """Найти готовый анализ такого же изображения: сначала в памяти, затем в БД"""
+    global _db_hits
+
+    if not content_hash:
+        return None
+
+    key = (content_hash, model_version)
+    analysis = result_cache.get(key)
+    if analysis is not None:
+        return analysis
+
+    stmt = (
+        select(Result.analysis_data)
+        .where(
+            Result.content_hash == content_hash,
+            Result.model_version == model_version,
+            Result.analysis_data.is_not(None),
+        )
+        .limit(1)
+    )
+    analysis = (await db.execute(stmt)).scalar_one_or_none()
+    if analysis is not None:
+        _db_hits += 1
+        result_cache.set(key, analysis)
+    return analysis
+
+
+async def find_cached_analyses(
+        db: AsyncSession,
+        content_hashes: Iterable[str],
+        model_version: str,
+) -> Dict[str, dict]:
+    """То же, что find_cached_analysis, но для многих хешей одним запросом"""
+    global _db_hits
+
+    found = {}
+    missing = set()
+    for content_hash in set(content_hashes):
+        analysis = result_cache.get((content_hash, model_version))
+        if analysis is not None:
+            found[content_hash] = analysis
+        else:
+            missing.add(content_hash)
+
+    if missing:
+        stmt = (
+            select(Result.content_hash, Result.analysis_data)
+            .where(
+                Result.content_hash.in_(missing),
+                Result.model_version == model_version,
+                Result.analysis_data.is_not(None),
+            )
+        )
+        for content_hash, analysis in (await db.execute(stmt)).all():
+            if content_hash not in found:
+                _db_hits += 1
+                found[content_hash] = analysis
+                result_cache.set((content_hash, model_version), analysis)
+    return found
+
+
+def remember_analysis(content_hash: Optional[str], model_version: str, analysis: dict):
+    if content_hash:
+        result_cache.set((content_hash, model_version), analysis)
+
+
+def load_model_input(path: str, content_hash: Optional[str] = None):
+    """Вход модели из хранилища тензоров; при промахе - декодирование файла и сохранение.
+
+    Блокирующая функция: вызывать в пуле потоков.
+    """
+    if tensor_store is None or not content_hash:
+        return load_image_array(path)
+    array = tensor_store.get(content_hash)
+    if array is None:
+        array = load_image_array(path)
+        tensor_store.put(content_hash, array)
+    return array
+
+
+def _prepare_image(path: str, content_hash: Optional[str]):
+    # Цвета считаем по уже уменьшенному входу модели: это единицы миллисекунд
+    array = load_model_input(path, content_hash)
+    return array, extract_dominant_colors(array)
+
+
+async def analyze_file(path: str, content_hash: Optional[str] = None) -> dict:
+    """Прогнать сохраненное изображение через модель"""
+    try:
+        with phase("preprocess"):
+            array, colors = await asyncio.to_thread(_prepare_image, path, content_hash)
+    except (UnidentifiedImageError, OSError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not decode image"
+        )
+
+    try:
+        with phase("inference"):
+            prediction = await inference_engine.predict(array)
+    except EngineOverloaded:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Analysis service is overloaded, try again later",
+            headers={"Retry-After": "1"},
+        )
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+            detail="Analysis timed out"
+        )
+
+    return {**prediction, "colors": colors}
+
+
+def image_values(
+        user_id: int,
+        stored: StoredFile,
+        filename: Optional[str],
+        content_type: Optional[str],
+) -> dict:
+    """Значения колонок Image (для ORM-объекта и для массовой вставки)"""
+    return {
+        "user_id": user_id,
+        "image_path": stored.path,
+        "filename": filename,
+        "content_type": content_type,
+        "file_size": stored.size,
+        "content_hash": stored.sha256,
+    }
+
+
+def result_values(
+        image_id: int,
+        user_id: int,
+        content_hash: Optional[str],
+        analysis: dict,
+        model_version: str,
+) -> dict:
+    """Значения колонок Result из ответа модели"""
+    return {
+        "image_id": image_id,
+        "user_id": user_id,
+        "style_type": analysis.get("style"),
+        "confidence_score": analysis.get("confidence"),
+        "dominant_colors": json.dumps(analysis.get("colors", [])),
+        "analysis_data": analysis,
+        "content_hash": content_hash,
+        "model_version": model_version,
+    }
+
+
+def build_image(
+        user_id: int,
+        stored: StoredFile,
+        filename: Optional[str],
+        content_type: Optional[str],
+) -> Image:
+    return Image(**image_values(user_id, stored, filename, content_type))
+
+
+def build_result(image: Image, analysis: dict, model_version: str) -> Result:
+    """Собрать строку Result из ответа модели"""
+    return Result(**result_values(image.id, image.user_id, image.content_hash, analysis, model_version))
+
+
+def current_result_condition(model_version: Optional[str] = None):
+    """Условие для Result: показываемый результат своего изображения.
+
+    У изображения может быть по результату на каждую версию модели (бэкфилл).
+    Показывается результат текущей MODEL_VERSION, а если его нет - последний.
+    История, выгрузка, похожие и профиль стиля считают по этому правилу.
+    """
+    model_version = model_version or settings.MODEL_VERSION
+    other = aliased(Result)
+    return or_(
+        Result.model_version == model_version,
+        ~exists().where(
+            other.image_id == Result.image_id,
+            or_(other.model_version == model_version, other.id > Result.id),
+        ),
+    )
+
+
+def result_cache_stats() -> dict:
+    """Статистика дедупликации: попадания в памяти, в БД и общий hit ratio"""
+    stats = result_cache.stats()
+    # Промах в памяти, найденный в БД, все равно экономит инференс
+    lookups = stats["hits"] + stats["misses"]
+    stats["db_hits"] = _db_hits
+    stats["total_hit_ratio"] = (stats["hits"] + _db_hits) / lookups if lookups else 0.0
+    return stats
+
+
+register_cache("analysis_results", result_cache_stats)
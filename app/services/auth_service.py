@@ -1,33 +1,60 @@
+import logging
+import time
 from datetime import datetime, timedelta
 from typing import Optional
-import bcrypt
 from jose import jwt, JWTError
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.core.cache import TTLCache
 from app.core.config import settings
-from app.core.db import get_db
+from app.core.db import AsyncSessionLocal, get_read_db
+from app.core.read_replica import current_user_id, is_replica_session
+from app.core.metrics import phase, register_cache
 from app.models.user import User
 from app.schemas.auth import UserLogin, UserRegister
+from app.services.password_hasher import password_hasher
+
+logger = logging.getLogger(__name__)
 
 # Простая Bearer аутентификация
 security = HTTPBearer(auto_error=False)
 
+# Кеш принципалов: токен -> user_id (без повторного jwt.decode)
+# и user_id -> User (без запроса в БД на каждый вызов). Кеши локальны для процесса,
+# поэтому пользователь хранится недолго, а на записи сверяется с БД (_still_current)
+_token_cache = TTLCache(settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_CACHE_TTL_SECONDS)
+_user_cache = TTLCache(settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_USER_TTL_SECONDS)
+
+# Методы, которые ничего не меняют: для них допустим пользователь из кеша без сверки
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+register_cache("principal_tokens", _token_cache.stats)
+register_cache("principal_users", _user_cache.stats)
+
+
+def invalidate_user_cache(user_id: int):
+    """Сбросить закешированного пользователя после изменения его данных"""
+    _user_cache.pop(user_id)
+
+
+def principal_cache_stats() -> dict:
+    return {"tokens": _token_cache.stats(), "users": _user_cache.stats()}
+
+
 def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+    return password_hasher.hash_sync(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    return password_hasher.verify_sync(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     to_encode = data.copy()
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(minutes=30)
+        expire = datetime.utcnow() + timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm="HS256")
     return encoded_jwt
@@ -40,22 +67,33 @@ async def authenticate_user(db: AsyncSession, login_data: UserLogin) -> Optional
         user = user_result.scalar_one_or_none()
 
         if not user:
-            print(f"❌ Пользователь с email {login_data.email} не найден")
+            logger.info("Пользователь с email %s не найден", login_data.email)
             return None
 
-        if not verify_password(login_data.password, user.password_hash):
-            print("❌ Неверный пароль")
+        if not await password_hasher.verify(login_data.password, user.password_hash):
+            logger.info("Неверный пароль для пользователя %s", user.id)
             return None
 
-        print(f"✅ Пользователь {user.email} аутентифицирован")
+        # Пересчитываем хеш, если изменился cost factor
+        if password_hasher.needs_rehash(user.password_hash):
+            try:
+                user.password_hash = await password_hasher.hash(login_data.password)
+                await db.commit()
+            except HTTPException:
+                # Пул перегружен - обновим хеш при следующем входе
+                await db.rollback()
+
+        logger.info("Пользователь %s аутентифицирован", user.id)
         return user
-    except Exception as e:
-        print(f"❌ Ошибка аутентификации: {e}")
+    except HTTPException:
+        raise
+    except Exception:
+        logger.exception("Ошибка аутентификации")
         return None
 
 async def register_user(db: AsyncSession, user_data: UserRegister) -> User:
     try:
-        print(f"🔵 Начало регистрации пользователя: {user_data.email}")
+        logger.debug("Начало регистрации пользователя: %s", user_data.email)
 
         # Проверяем email
         existing_user = await db.execute(
@@ -72,8 +110,8 @@ async def register_user(db: AsyncSession, user_data: UserRegister) -> User:
             raise HTTPException(status_code=400, detail="Имя пользователя уже занято")
 
         # Хешируем пароль
-        hashed_password = hash_password(user_data.password)
-        print("🔵 Пароль захэширован")
+        hashed_password = await password_hasher.hash(user_data.password)
+        logger.debug("Пароль захэширован")
 
         # Создаем пользователя
         new_user = User(
@@ -86,47 +124,96 @@ async def register_user(db: AsyncSession, user_data: UserRegister) -> User:
         await db.commit()
         await db.refresh(new_user)
 
-        print(f"✅ Пользователь {new_user.email} создан с ID {new_user.id}")
+        logger.info("Пользователь %s создан с ID %s", new_user.email, new_user.id)
         return new_user
 
     except HTTPException:
         raise
     except Exception as e:
-        print(f"❌ Критическая ошибка регистрации: {e}")
+        logger.exception("Критическая ошибка регистрации")
         await db.rollback()
         raise HTTPException(status_code=500, detail=f"Ошибка сервера: {str(e)}")
 
+async def _load_from_primary(user_id: int) -> Optional[User]:
+    async with AsyncSessionLocal() as primary:
+        user = (await primary.execute(select(User).where(User.id == user_id))).scalar_one_or_none()
+        if user is not None:
+            primary.expunge(user)
+            _user_cache.set(user_id, user)
+        return user
+
+
+async def _still_current(user: User) -> bool:
+    """Не изменился ли пользователь из кеша (например, в другом воркере): сверка с основной БД"""
+    async with AsyncSessionLocal() as primary:
+        updated_at = await primary.scalar(select(User.updated_at).where(User.id == user.id))
+    if updated_at is not None and updated_at == user.updated_at:
+        return True
+    _user_cache.pop(user.id)
+    return False
+
+
 # Вспомогательная функция для получения пользователя по токену
-async def get_current_user(db: AsyncSession, token: str) -> User:
+async def get_current_user(db: AsyncSession, token: str, write: bool = False) -> User:
+    """Пользователь по токену. write=True - запрос что-то меняет: пользователь
+    из кеша сверяется с основной БД, а при промахе читается с нее"""
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        user_id: str = payload.get("sub")
-        if user_id is None:
+    user_id = _token_cache.get(token)
+    if user_id is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+            sub: str = payload.get("sub")
+            if sub is None:
+                raise credentials_exception
+            user_id = int(sub)
+
+            logger.debug("Декодирован токен для user_id: %s", user_id)
+        except (JWTError, ValueError) as e:
+            logger.info("Ошибка JWT: %s", e)
             raise credentials_exception
 
-        print(f"🔵 Декодирован токен для user_id: {user_id}")
-    except JWTError as e:
-        print(f"❌ Ошибка JWT: {e}")
-        raise credentials_exception
+        # Токен не должен жить в кеше дольше своего exp
+        ttl = settings.PRINCIPAL_CACHE_TTL_SECONDS
+        if payload.get("exp") is not None:
+            ttl = min(ttl, payload["exp"] - time.time())
+        if ttl > 0:
+            _token_cache.set(token, user_id, ttl=ttl)
+
+    current_user_id.set(user_id)
+    user = _user_cache.get(user_id)
+    if user is not None and (not write or await _still_current(user)):
+        return user
 
-    user_result = await db.execute(select(User).where(User.id == int(user_id)))
-    user = user_result.scalar_one_or_none()
+    if write and is_replica_session(db):
+        # Реплика может отставать от изменения, из-за которого сверка не прошла
+        user = await _load_from_primary(user_id)
+    else:
+        user_result = await db.execute(select(User).where(User.id == user_id))
+        user = user_result.scalar_one_or_none()
+        if user is None and is_replica_session(db):
+            # Реплика могла еще не получить только что созданного пользователя
+            user = await _load_from_primary(user_id)
+        elif user is not None:
+            # Кешируем отсоединенный объект: он переживает сессию запроса.
+            # Для изменения пользователя его нужно загрузить в сессию через db.merge()
+            db.expunge(user)
+            _user_cache.set(user_id, user)
     if user is None:
-        print(f"❌ Пользователь с ID {user_id} не найден в БД")
+        logger.warning("Пользователь с ID %s из токена не найден в БД", user_id)
         raise credentials_exception
 
-    print(f"✅ Найден пользователь: {user.email}")
+    logger.debug("Найден пользователь: %s", user_id)
     return user
 
 # Зависимости для защиты эндпоинтов
 async def get_current_user_dependency(
+    request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: AsyncSession = Depends(get_db)
+    db: AsyncSession = Depends(get_read_db)
 ) -> User:
     if not credentials:
         raise HTTPException(
@@ -134,7 +221,8 @@ async def get_current_user_dependency(
             detail="Not authenticated",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    return await get_current_user(db, credentials.credentials)
+    with phase("auth"):
+        return await get_current_user(db, credentials.credentials, request.method not in SAFE_METHODS)
 
 async def get_current_active_user_dependency(
     current_user: User = Depends(get_current_user_dependency)
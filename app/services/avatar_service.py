@@ -0,0 +1,87 @@
+import asyncio
+import os
+import re
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile, status
+from PIL import Image as PILImage, ImageOps, UnidentifiedImageError
+
+from app.core.config import settings
+from app.services.storage_service import iter_upload, safe_extension, stream_to_temp
+
+# Размеры квадратных превью, создаваемых при загрузке
+AVATAR_SIZES = (64, 128, 256)
+
+# avatar_<user_id>_<первые 16 символов sha256>.<ext>; старый формат - без хеша
+# и с расширением от клиента в любом регистре (avatar_1.JPG)
+AVATAR_FILENAME_RE = re.compile(r"avatar_(\d+)(?:_([0-9a-f]{16}))?\.((?i:[a-z0-9]{1,5}))")
+
+
+def avatars_dir() -> str:
+    return os.path.join(settings.UPLOAD_DIR, "avatars")
+
+
+def thumbnail_name(stem: str, size: int) -> str:
+    return f"{stem}_{size}.webp"
+
+
+def _write_thumbnails(source_path: str, stem: str):
+    directory = avatars_dir()
+    with PILImage.open(source_path) as img:
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        # Уменьшаем от большего к меньшему: каждый следующий ресайз дешевле
+        for size in sorted(AVATAR_SIZES, reverse=True):
+            img = ImageOps.fit(img, (size, size), PILImage.LANCZOS)
+            final_path = os.path.join(directory, thumbnail_name(stem, size))
+            tmp_path = f"{final_path}.part"
+            img.save(tmp_path, "WEBP", quality=85)
+            os.replace(tmp_path, final_path)
+
+
+def _remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+async def save_avatar(user_id: int, file: UploadFile) -> str:
+    """Сохранить аватар и его превью. Возвращает имя файла оригинала.
+
+    Имя содержит хеш содержимого, поэтому файл по нему никогда не меняется
+    и может кешироваться клиентами навсегда.
+    """
+    directory = avatars_dir()
+    tmp = await stream_to_temp(iter_upload(file), directory, settings.MAX_AVATAR_SIZE_BYTES)
+    stem = f"avatar_{user_id}_{tmp.sha256[:16]}"
+
+    try:
+        await asyncio.to_thread(_write_thumbnails, tmp.path, stem)
+    except PILImage.DecompressionBombError:
+        # Больше Image.MAX_IMAGE_PIXELS * 2 пикселей: распаковка заняла бы гигабайты памяти
+        await asyncio.to_thread(_remove_files, [tmp.path])
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail="Image dimensions are too large"
+        )
+    except (UnidentifiedImageError, OSError, SyntaxError, ValueError):
+        # Усеченный или поврежденный файл: декодеры Pillow бросают не только OSError
+        await asyncio.to_thread(_remove_files, [tmp.path])
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Could not decode image"
+        )
+
+    filename = f"{stem}{safe_extension(file.filename) or '.img'}"
+    await asyncio.to_thread(os.replace, tmp.path, os.path.join(directory, filename))
+    return filename
+
+
+async def remove_avatar(filename: Optional[str]):
+    """Удалить оригинал и превью предыдущего аватара"""
+    if not filename or not AVATAR_FILENAME_RE.fullmatch(filename):
+        return
+    stem = filename.rsplit(".", 1)[0]
+    names = [filename] + [thumbnail_name(stem, size) for size in AVATAR_SIZES]
+    await asyncio.to_thread(_remove_files, [os.path.join(avatars_dir(), name) for name in names])
@@ -0,0 +1,188 @@
+import asyncio
+import mimetypes
+import os
+import zipfile
+from dataclasses import dataclass
+from typing import AsyncIterator, Callable, List, Optional
+
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.response_cache import response_cache, results_tag
+from app.models.image import Image
+from app.models.result import Result
+from app.services.analysis_service import (
+    analyze_file,
+    find_cached_analyses,
+    image_values,
+    remember_analysis,
+    result_values,
+)
+from app.services.storage_service import StoredFile, iter_upload, iter_zip_member, safe_extension, store_stream
+from app.services.similarity_service import IndexEntry, schedule_indexing
+from app.services.summary_service import add_analyses_to_summary
+
+ZIP_CONTENT_TYPES = {"application/zip", "application/x-zip-compressed"}
+
+
+@dataclass
+class BatchItem:
+    """Одно изображение пакета: отдельный файл формы или файл из архива"""
+    index: int
+    filename: Optional[str]
+    content_type: Optional[str]
+    open_chunks: Optional[Callable[[], AsyncIterator[bytes]]] = None
+    stored: Optional[StoredFile] = None
+    analysis: Optional[dict] = None
+    error: Optional[str] = None
+    image_id: Optional[int] = None
+    result_id: Optional[int] = None
+
+
+def _is_zip(file: UploadFile) -> bool:
+    return file.content_type in ZIP_CONTENT_TYPES or (file.filename or "").lower().endswith(".zip")
+
+
+def _zip_images(archive: zipfile.ZipFile) -> List[zipfile.ZipInfo]:
+    # Служебные файлы архиваторов (__MACOSX, .DS_Store) пропускаем молча
+    return [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and not info.filename.startswith("__MACOSX/")
+        and not os.path.basename(info.filename).startswith(".")
+    ]
+
+
+class BatchCollector:
+    """Раскрывает загруженные файлы и zip-архивы в список BatchItem.
+
+    Архивы остаются открытыми до close(), чтобы файлы читались из них потоково.
+    """
+
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+        self.items: List[BatchItem] = []
+        self._archives: List[zipfile.ZipFile] = []
+
+    def _add(self, **fields) -> BatchItem:
+        if len(self.items) >= self.max_items:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Too many images in batch (max {self.max_items})"
+            )
+        item = BatchItem(index=len(self.items), **fields)
+        self.items.append(item)
+        return item
+
+    async def add_upload(self, file: UploadFile):
+        if not _is_zip(file):
+            self._add(filename=file.filename, content_type=file.content_type,
+                      open_chunks=lambda: iter_upload(file))
+            return
+
+        try:
+            archive = await asyncio.to_thread(zipfile.ZipFile, file.file)
+        except zipfile.BadZipFile:
+            self._add(filename=file.filename, content_type=file.content_type,
+                      error="Could not read zip archive")
+            return
+        self._archives.append(archive)
+
+        for info in _zip_images(archive):
+            name = os.path.basename(info.filename)
+            content_type = mimetypes.guess_type(name)[0]
+            item = self._add(filename=name, content_type=content_type,
+                             open_chunks=lambda info=info: iter_zip_member(archive, info))
+            if info.file_size > settings.MAX_UPLOAD_SIZE_BYTES:
+                item.error = f"File is larger than {settings.MAX_UPLOAD_SIZE_BYTES} bytes"
+
+    def close(self):
+        for archive in self._archives:
+            archive.close()
+
+
+async def _store_item(item: BatchItem, slots: asyncio.Semaphore):
+    if item.error:
+        return
+    if not (item.content_type or "").startswith("image/"):
+        item.error = "File must be an image"
+        return
+    async with slots:
+        try:
+            item.stored = await store_stream(item.open_chunks(), safe_extension(item.filename))
+        except HTTPException as e:
+            item.error = e.detail
+
+
+async def _analyze_path(path: str, content_hash: str, slots: asyncio.Semaphore):
+    async with slots:
+        try:
+            return await analyze_file(path, content_hash)
+        except HTTPException as e:
+            return e
+
+
+async def analyze_batch(db: AsyncSession, user_id: int, items: List[BatchItem]):
+    """Сохранить, проанализировать и записать в БД пакет изображений.
+
+    Файлы сохраняются и анализируются параллельно (не больше BATCH_CONCURRENCY
+    одновременно), одинаковые изображения анализируются один раз. Готовые
+    анализы ищутся одним запросом, а все Image и Result вставляются двумя
+    массовыми INSERT ... RETURNING в одной транзакции. Ошибка отдельного
+    изображения записывается в item.error и не прерывает пакет.
+    """
+    model_version = settings.MODEL_VERSION
+    slots = asyncio.Semaphore(settings.BATCH_CONCURRENCY)
+
+    await asyncio.gather(*(_store_item(item, slots) for item in items))
+    stored = [item for item in items if item.stored is not None]
+
+    analyses = await find_cached_analyses(db, (item.stored.sha256 for item in stored), model_version)
+    pending = {}
+    for item in stored:
+        if item.stored.sha256 not in analyses:
+            pending.setdefault(item.stored.sha256, item.stored.path)
+
+    fresh = dict(zip(pending, await asyncio.gather(
+        *(_analyze_path(path, content_hash, slots) for content_hash, path in pending.items())
+    )))
+
+    ready = []
+    for item in stored:
+        analysis = analyses.get(item.stored.sha256) or fresh.get(item.stored.sha256)
+        if isinstance(analysis, HTTPException):
+            item.error = analysis.detail
+        else:
+            item.analysis = analysis
+            ready.append(item)
+
+    if ready:
+        image_ids = (await db.execute(
+            insert(Image).returning(Image.id, sort_by_parameter_order=True),
+            [image_values(user_id, item.stored, item.filename, item.content_type) for item in ready],
+        )).scalars().all()
+        for item, image_id in zip(ready, image_ids):
+            item.image_id = image_id
+
+        result_ids = (await db.execute(
+            insert(Result).returning(Result.id, sort_by_parameter_order=True),
+            [result_values(item.image_id, user_id, item.stored.sha256, item.analysis, model_version)
+             for item in ready],
+        )).scalars().all()
+        for item, result_id in zip(ready, result_ids):
+            item.result_id = result_id
+        await add_analyses_to_summary(db, user_id, [item.analysis for item in ready])
+        await db.commit()
+
+    for content_hash, analysis in fresh.items():
+        if not isinstance(analysis, HTTPException):
+            remember_analysis(content_hash, model_version, analysis)
+
+    if ready:
+        response_cache.invalidate(results_tag(user_id))
+    schedule_indexing([
+        IndexEntry(item.result_id, user_id, item.stored.sha256, item.stored.path, item.analysis)
+        for item in ready
+    ])
@@ -0,0 +1,81 @@
+"""Потоковая выгрузка истории анализов пользователя в NDJSON и CSV.
+
+Результаты читаются keyset-страницами по (created_at, id), каждая в своей
+короткой сессии чтения (реплика, если доступна). Между страницами
+соединение возвращается в пул, поэтому медленный клиент не держит
+транзакцию, а память ограничена одной страницей независимо от объема истории.
+"""
+import csv
+import io
+import json
+from typing import AsyncIterator, List
+
+from fastapi import Request
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app.core.config import settings
+from app.core.db import read_session
+from app.core.pagination import keyset_paginate, split_page
+from app.models.result import Result
+from app.schemas.result import ResultResponse
+from app.services.analysis_service import current_result_condition
+
+EXPORT_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+CSV_COLUMNS = [
+    "id", "image_id", "created_at", "model_version",
+    "style_type", "confidence_score", "dominant_colors", "analysis_data",
+]
+
+_results_adapter = TypeAdapter(List[ResultResponse])
+
+
+async def iter_result_pages(request: Request, user_id: int) -> AsyncIterator[List[ResultResponse]]:
+    """Результаты пользователя страницами по EXPORT_CHUNK_SIZE, новые сверху"""
+    size = settings.EXPORT_CHUNK_SIZE
+    stmt = select(Result).where(Result.user_id == user_id, current_result_condition())
+    cursor = None
+    while True:
+        async with read_session(request) as db:
+            rows = (await db.execute(keyset_paginate(stmt, Result, cursor, size))).scalars().all()
+            # Валидируем до закрытия сессии: после него ORM-объекты не нужны
+            page, cursor = split_page(rows, size)
+            results = _results_adapter.validate_python(page, from_attributes=True)
+        if results:
+            yield results
+        if cursor is None:
+            return
+
+
+def _ndjson(results: List[ResultResponse]) -> bytes:
+    return b"".join(result.model_dump_json().encode() + b"\n" for result in results)
+
+
+def _csv(rows) -> bytes:
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    return out.getvalue().encode()
+
+
+def _csv_row(result: ResultResponse) -> list:
+    # Списки и словари (цвета, ответ модели) пишутся в ячейку как JSON
+    data = result.model_dump(mode="json")
+    return [
+        json.dumps(data[column]) if isinstance(data[column], (list, dict)) else data[column]
+        for column in CSV_COLUMNS
+    ]
+
+
+async def export_results(request: Request, user_id: int, export_format: str) -> AsyncIterator[bytes]:
+    """Тело выгрузки: один кусок на страницу результатов"""
+    if export_format == "csv":
+        yield _csv([CSV_COLUMNS])
+    async for results in iter_result_pages(request, user_id):
+        if export_format == "csv":
+            yield _csv(_csv_row(result) for result in results)
+        else:
+            yield _ndjson(results)
@@ -0,0 +1,225 @@
+import asyncio
+import logging
+import time
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, select, update
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal, db_time_ago
+from app.core.response_cache import response_cache, results_tag
+from app.models.image import Image
+from app.models.job import AnalysisJob, JOB_DONE, JOB_FAILED, JOB_PENDING, JOB_RUNNING
+from app.services.analysis_service import (
+    analyze_file,
+    build_result,
+    find_cached_analysis,
+    remember_analysis,
+)
+from app.services.similarity_service import IndexEntry, schedule_indexing
+from app.services.summary_service import add_analyses_to_summary
+
+logger = logging.getLogger(__name__)
+
+
+class JobWorkerPool:
+    """Фоновые воркеры, разбирающие очередь задач анализа из таблицы analysis_jobs.
+
+    Каждый воркер - asyncio-задача: забирает самую старую pending-задачу,
+    прогоняет изображение через движок инференса (CPU-работа уходит в его
+    пул процессов) и сохраняет Result. Таблица служит очередью, поэтому
+    задачи переживают перезапуск и разбираются несколькими процессами.
+    """
+
+    def __init__(self, workers: int, poll_interval: float):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._next_requeue = 0.0
+        # Подписчики на изменение статуса задач в этом процессе (SSE)
+        self._listeners: Dict[int, asyncio.Event] = {}
+
+    async def start(self):
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        await self._requeue_stale()
+        self._next_requeue = time.monotonic() + settings.JOB_REQUEUE_INTERVAL_SECONDS
+        self._tasks = [asyncio.create_task(self._worker_loop()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Разбудить воркеры после постановки новой задачи"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def wait_for_update(self, job_id: int, timeout: float):
+        """Дождаться изменения статуса задачи в этом процессе или таймаута"""
+        event = self._listeners.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            if self._listeners.get(job_id) is event:
+                del self._listeners[job_id]
+
+    def _publish(self, job_id: int):
+        event = self._listeners.get(job_id)
+        if event is not None:
+            event.set()
+
+    async def _requeue_stale(self):
+        # Задачи, зависшие в running после падения процесса, возвращаем в очередь.
+        # Порог считается по часам БД: updated_at пишет она же (func.now())
+        async with AsyncSessionLocal() as db:
+            stale = and_(
+                AnalysisJob.status == JOB_RUNNING,
+                AnalysisJob.updated_at < db_time_ago(db, settings.JOB_STALE_SECONDS),
+            )
+            requeued = await db.execute(
+                update(AnalysisJob)
+                .where(stale, AnalysisJob.attempts < settings.JOB_MAX_ATTEMPTS)
+                .values(status=JOB_PENDING)
+            )
+            # Попытки исчерпаны: изображение, скорее всего, роняет или вешает воркер
+            failed = await db.execute(
+                update(AnalysisJob)
+                .where(stale, AnalysisJob.attempts >= settings.JOB_MAX_ATTEMPTS)
+                .values(status=JOB_FAILED, error="Worker stopped while processing the job")
+            )
+            await db.commit()
+        if requeued.rowcount or failed.rowcount:
+            logger.warning(
+                "Зависшие задачи анализа: %d возвращено в очередь, %d завершено с ошибкой",
+                requeued.rowcount, failed.rowcount,
+            )
+
+    async def _maybe_requeue_stale(self):
+        # Задачи другого упавшего процесса иначе остались бы в running до перезапуска этого;
+        # срок сдвигается до await, поэтому проверку делает один воркер процесса
+        if time.monotonic() < self._next_requeue:
+            return
+        self._next_requeue = time.monotonic() + settings.JOB_REQUEUE_INTERVAL_SECONDS
+        try:
+            await self._requeue_stale()
+        except Exception:
+            logger.exception("Ошибка возврата зависших задач анализа в очередь")
+
+    async def _worker_loop(self):
+        while True:
+            await self._maybe_requeue_stale()
+            try:
+                job_id = await self._claim()
+            except Exception:
+                logger.exception("Ошибка получения задачи анализа")
+                job_id = None
+
+            if job_id is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+                continue
+
+            try:
+                await self._process(job_id)
+            except Exception:
+                # Например, БД недоступна при записи статуса: задачу вернет _requeue_stale
+                logger.exception("Ошибка обработки задачи анализа %s", job_id)
+
+    async def _claim(self) -> Optional[int]:
+        async with AsyncSessionLocal() as db:
+            stmt = (
+                select(AnalysisJob.id)
+                .where(AnalysisJob.status == JOB_PENDING)
+                .order_by(AnalysisJob.id)
+                .limit(1)
+                .with_for_update(skip_locked=True)
+            )
+            job_id = (await db.execute(stmt)).scalar_one_or_none()
+            if job_id is None:
+                return None
+
+            # Условный UPDATE: задачу получит только один воркер, даже без SKIP LOCKED
+            claimed = await db.execute(
+                update(AnalysisJob)
+                .where(AnalysisJob.id == job_id, AnalysisJob.status == JOB_PENDING)
+                .values(status=JOB_RUNNING, attempts=AnalysisJob.attempts + 1)
+            )
+            await db.commit()
+            return job_id if claimed.rowcount == 1 else None
+
+    async def _process(self, job_id: int):
+        async with AsyncSessionLocal() as db:
+            try:
+                job = await db.get(AnalysisJob, job_id)
+                if job is None:
+                    logger.warning("Задача анализа %s удалена до обработки", job_id)
+                    return
+                image = await db.get(Image, job.image_id)
+                if image is None:
+                    raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Image not found")
+
+                analysis = await find_cached_analysis(db, image.content_hash, settings.MODEL_VERSION)
+                cached = analysis is not None
+                if not cached:
+                    analysis = await analyze_file(image.image_path, image.content_hash)
+
+                result = build_result(image, analysis, settings.MODEL_VERSION)
+                db.add(result)
+                await add_analyses_to_summary(db, image.user_id, [analysis])
+                await db.flush()
+
+                job.status = JOB_DONE
+                job.result_id = result.id
+                job.error = None
+                await db.commit()
+
+                if not cached:
+                    remember_analysis(image.content_hash, settings.MODEL_VERSION, analysis)
+                response_cache.invalidate(results_tag(image.user_id))
+                schedule_indexing([
+                    IndexEntry(result.id, image.user_id, image.content_hash, image.image_path, analysis)
+                ])
+            except HTTPException as e:
+                # После rollback объекты сессии истекают - перечитываем задачу
+                await db.rollback()
+                job = await db.get(AnalysisJob, job_id)
+                if job is None:
+                    return
+                # Перегрузку движка переживаем повтором, ошибки входных данных - нет
+                retry = (
+                    e.status_code in (status.HTTP_503_SERVICE_UNAVAILABLE, status.HTTP_504_GATEWAY_TIMEOUT)
+                    and job.attempts < settings.JOB_MAX_ATTEMPTS
+                )
+                job.status = JOB_PENDING if retry else JOB_FAILED
+                job.error = None if retry else str(e.detail)[:255]
+                await db.commit()
+                if retry:
+                    await asyncio.sleep(self.poll_interval)
+            except Exception as e:
+                logger.exception("Ошибка задачи анализа %s", job_id)
+                await db.rollback()
+                job = await db.get(AnalysisJob, job_id)
+                if job is None:
+                    return
+                job.status = JOB_FAILED
+                job.error = str(e)[:255]
+                await db.commit()
+            finally:
+                self._publish(job_id)
+
+
+job_workers = JobWorkerPool(
+    workers=settings.JOB_WORKERS,
+    poll_interval=settings.JOB_POLL_INTERVAL_SECONDS,
+)
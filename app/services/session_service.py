@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import logging
+import secrets
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import delete, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.db import AsyncSessionLocal
+from app.models.session import Session
+
+logger = logging.getLogger(__name__)
+
+
+def hash_refresh_token(token: str) -> str:
+    # Токен - 256 случайных бит, медленный хеш вроде bcrypt ему не нужен
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _new_token() -> Tuple[str, str, datetime]:
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    return token, hash_refresh_token(token), expires_at
+
+
+async def create_session(db: AsyncSession, user_id: int) -> str:
+    """Создать refresh-сессию и вернуть токен. В БД сохраняется только его хеш"""
+    token, token_hash, expires_at = _new_token()
+    db.add(Session(user_id=user_id, token=token_hash, expires_at=expires_at))
+    await db.commit()
+    return token
+
+
+async def rotate_session(db: AsyncSession, token: str) -> Optional[Tuple[int, str]]:
+    """Обменять refresh-токен на новый одним UPDATE по уникальному индексу.
+
+    Возвращает (user_id, новый токен) или None, если токен неизвестен, отозван
+    или просрочен. Старый токен после обмена недействителен, поэтому
+    повторное использование перехваченного токена не проходит.
+    """
+    new_token, new_hash, expires_at = _new_token()
+    stmt = (
+        update(Session)
+        .where(Session.token == hash_refresh_token(token), Session.expires_at > datetime.utcnow())
+        .values(token=new_hash, expires_at=expires_at)
+        .returning(Session.user_id)
+    )
+    user_id = (await db.execute(stmt)).scalar_one_or_none()
+    await db.commit()
+    if user_id is None:
+        return None
+    return user_id, new_token
+
+
+async def revoke_session(db: AsyncSession, token: str):
+    await db.execute(delete(Session).where(Session.token == hash_refresh_token(token)))
+    await db.commit()
+
+
+async def revoke_user_sessions(db: AsyncSession, user_id: int) -> int:
+    """Отозвать все refresh-сессии пользователя. Выданные access-токены живут до своего exp"""
+    result = await db.execute(delete(Session).where(Session.user_id == user_id))
+    await db.commit()
+    return result.rowcount
+
+
+async def purge_expired_sessions(batch_size: int) -> int:
+    """Удалить просроченные сессии пачками, чтобы не держать долгих блокировок"""
+    total = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            expired = (
+                select(Session.id)
+                .where(Session.expires_at < datetime.utcnow())
+                .order_by(Session.expires_at)
+                .limit(batch_size)
+                .scalar_subquery()
+            )
+            result = await db.execute(delete(Session).where(Session.id.in_(expired)))
+            await db.commit()
+        total += result.rowcount
+        if result.rowcount < batch_size:
+            return total
+        # Между пачками отдаем БД другим запросам
+        await asyncio.sleep(0)
+
+
+class SessionPurger:
+    """Периодическая очистка просроченных refresh-сессий"""
+
+    def __init__(self, interval: float, batch_size: int):
+        self.interval = interval
+        self.batch_size = batch_size
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                purged = await purge_expired_sessions(self.batch_size)
+                if purged:
+                    logger.info("Удалено просроченных сессий: %d", purged)
+            except Exception:
+                logger.exception("Ошибка очистки сессий")
+            await asyncio.sleep(self.interval)
+
+
+session_purger = SessionPurger(settings.SESSION_PURGE_INTERVAL_SECONDS, settings.SESSION_PURGE_BATCH_SIZE)
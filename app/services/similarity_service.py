@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import Iterable, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.ml.embedding import EMBEDDING_DIM, build_embedding
+from app.ml.vector_index import VectorIndex, content_key
+from app.services.analysis_service import load_model_input
+
+logger = logging.getLogger(__name__)
+
+similarity_index = VectorIndex(
+    settings.SIMILARITY_INDEX_PATH or os.path.join(settings.UPLOAD_DIR, "similarity", "vectors.bin"),
+    EMBEDDING_DIM,
+    ivf_threshold=settings.SIMILARITY_IVF_THRESHOLD,
+    nprobe=settings.SIMILARITY_NPROBE,
+)
+
+
+@dataclass
+class IndexEntry:
+    """Сохраненный результат, для которого нужен вектор"""
+    result_id: int
+    user_id: int
+    content_hash: Optional[str]
+    image_path: str
+    analysis: dict
+
+
+def embed_result(image_path: str, content_hash: Optional[str], analysis: dict):
+    """Вектор результата по входу модели (из хранилища тензоров) и scores анализа"""
+    return build_embedding(load_model_input(image_path, content_hash), analysis.get("scores", {}))
+
+
+_last_refresh = 0.0
+_training = False
+# Ссылки на фоновые задачи, чтобы их не собрал GC до завершения
+_tasks: Set[asyncio.Task] = set()
+
+
+async def _train_if_needed():
+    global _training
+    if _training or not similarity_index.needs_training():
+        return
+    _training = True
+    try:
+        started = time.perf_counter()
+        state = await asyncio.to_thread(similarity_index.train)
+        similarity_index.install(state)
+        logger.info(
+            "IVF обучен: %d векторов, %d кластеров за %.1f с",
+            state.trained_count, len(state.centroids), time.perf_counter() - started,
+        )
+    finally:
+        _training = False
+
+
+async def load_similarity_index():
+    """Загрузить файл векторов при старте (в потоке: файл может быть большим)"""
+    global _last_refresh
+    started = time.perf_counter()
+    loaded = await asyncio.to_thread(similarity_index.refresh)
+    _last_refresh = time.monotonic()
+    logger.info("Индекс похожих изображений: %d векторов за %.2f с", loaded, time.perf_counter() - started)
+    await _train_if_needed()
+
+
+def refresh_similarity_index():
+    """Догрузить векторы, записанные другими процессами, не чаще SIMILARITY_REFRESH_SECONDS.
+
+    Блокирующая функция: вызывать в пуле потоков.
+    """
+    global _last_refresh
+    now = time.monotonic()
+    if now - _last_refresh < settings.SIMILARITY_REFRESH_SECONDS:
+        return
+    _last_refresh = now
+    similarity_index.refresh()
+
+
+def schedule_training():
+    """Переобучить IVF в фоне, если индекс достаточно вырос"""
+    if similarity_index.needs_training():
+        _schedule(_train_if_needed())
+
+
+async def index_results(entries: Iterable[IndexEntry]):
+    """Посчитать и записать векторы новых результатов.
+
+    Вектор строится по сохраненному файлу и scores анализа, поэтому не
+    требует повторного инференса; для повторной загрузки того же
+    изображения берется уже посчитанный вектор.
+    """
+    for entry in entries:
+        if similarity_index.has_result(entry.result_id):
+            continue
+        key = content_key(entry.content_hash)
+        vector = similarity_index.vector_for_key(key)
+        try:
+            if vector is None:
+                vector = await asyncio.to_thread(embed_result, entry.image_path, entry.content_hash, entry.analysis)
+            await asyncio.to_thread(similarity_index.append, entry.result_id, entry.user_id, key, vector)
+        except Exception:
+            logger.exception("Не удалось проиндексировать результат %s", entry.result_id)
+    await _train_if_needed()
+
+
+def _schedule(coro):
+    task = asyncio.create_task(coro)
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+
+
+def schedule_indexing(entries: List[IndexEntry]):
+    """Проиндексировать результаты в фоне, не задерживая ответ. Вызывается после commit"""
+    if entries:
+        _schedule(index_results(entries))
+
+
+def find_similar(
+        result_id: int,
+        content_hash: Optional[str],
+        limit: int,
+        user_id: Optional[int] = None,
+) -> Optional[List[Tuple[int, float]]]:
+    """Похожие результаты [(result_id, близость)]; None, если вектора еще нет.
+
+    Результат, добавленный бэкфиллом, может отсутствовать в индексе - тогда
+    вектор берется по содержимому изображения. Блокирующая функция (чтение
+    файла индекса, перебор векторов): вызывать в пуле потоков.
+    """
+    refresh_similarity_index()
+    query = similarity_index.vector_for_result(result_id)
+    if query is None and content_hash:
+        query = similarity_index.vector_for_key(content_key(content_hash))
+    if query is None:
+        return None
+    return similarity_index.search(query, limit, user_id=user_id, exclude_result=result_id)
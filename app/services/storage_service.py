@@ -0,0 +1,132 @@
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+import zipfile
+from dataclasses import dataclass
+from typing import AsyncIterator, Optional
+
+from fastapi import HTTPException, UploadFile, status
+
+from app.core.config import settings
+
+
+@dataclass
+class StoredFile:
+    path: str
+    sha256: str
+    size: int
+
+
+def safe_extension(filename: Optional[str]) -> str:
+    """Расширение файла в виде '.jpg' или пустая строка для подозрительных имен"""
+    if not filename or "." not in filename:
+        return ""
+    ext = filename.rsplit(".", 1)[-1].lower()
+    if not re.fullmatch(r"[a-z0-9]{1,5}", ext):
+        return ""
+    return f".{ext}"
+
+
+async def iter_upload(file: UploadFile, chunk_size: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Читать загруженный файл кусками, не поднимая его целиком в память"""
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+async def iter_zip_member(
+        archive: zipfile.ZipFile,
+        info: zipfile.ZipInfo,
+        chunk_size: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """Читать файл из zip-архива кусками, распаковывая в пуле потоков"""
+    chunk_size = chunk_size or settings.UPLOAD_CHUNK_SIZE
+    member = await asyncio.to_thread(archive.open, info)
+    try:
+        while True:
+            chunk = await asyncio.to_thread(member.read, chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        member.close()
+
+
+def _write_chunk(out, digest, chunk: bytes):
+    # hashlib отпускает GIL на больших буферах, поэтому считаем хеш в том же потоке
+    digest.update(chunk)
+    out.write(chunk)
+
+
+def _remove_quietly(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+async def stream_to_temp(
+        chunks: AsyncIterator[bytes],
+        directory: str,
+        max_size: Optional[int] = None,
+) -> StoredFile:
+    """Записать поток во временный файл, считая SHA-256 и проверяя размер"""
+    max_size = max_size or settings.MAX_UPLOAD_SIZE_BYTES
+    await asyncio.to_thread(os.makedirs, directory, exist_ok=True)
+    fd, tmp_path = await asyncio.to_thread(tempfile.mkstemp, dir=directory, suffix=".part")
+
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as out:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_size:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"File is larger than {max_size} bytes"
+                    )
+                await asyncio.to_thread(_write_chunk, out, digest, chunk)
+    except BaseException:
+        await asyncio.to_thread(_remove_quietly, tmp_path)
+        raise
+
+    return StoredFile(path=tmp_path, sha256=digest.hexdigest(), size=size)
+
+
+def _commit_file(tmp_path: str, final_path: str):
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    if os.path.exists(final_path):
+        # Такой файл уже сохранен - дубликат не храним
+        os.remove(tmp_path)
+    else:
+        os.replace(tmp_path, final_path)
+
+
+async def store_stream(
+        chunks: AsyncIterator[bytes],
+        extension: str = "",
+        subdir: str = "images",
+        max_size: Optional[int] = None,
+) -> StoredFile:
+    """Сохранить поток по хешу содержимого: одинаковые файлы хранятся один раз"""
+    base_dir = os.path.join(settings.UPLOAD_DIR, subdir)
+    tmp = await stream_to_temp(chunks, base_dir, max_size)
+
+    final_path = os.path.join(base_dir, tmp.sha256[:2], f"{tmp.sha256}{extension}")
+    await asyncio.to_thread(_commit_file, tmp.path, final_path)
+
+    return StoredFile(path=final_path, sha256=tmp.sha256, size=tmp.size)
+
+
+async def save_upload(
+        file: UploadFile,
+        subdir: str = "images",
+        max_size: Optional[int] = None,
+) -> StoredFile:
+    return await store_stream(iter_upload(file), safe_extension(file.filename), subdir, max_size)
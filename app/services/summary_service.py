@@ -0,0 +1,119 @@
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.db import dialect_insert
+from app.models.summary import StyleSummary
+from app.schemas.summary import StyleSummaryResponse, TopColor
+
+TOP_COLORS = 5
+
+
+@dataclass
+class SummaryDelta:
+    """Приращение агрегатов профиля по набору результатов"""
+    total_results: int = 0
+    confidence_sum: float = 0.0
+    confidence_count: int = 0
+    style_counts: Counter = field(default_factory=Counter)
+    color_counts: Counter = field(default_factory=Counter)
+
+    def add(self, style_type: Optional[str], confidence: Optional[float], colors: Optional[List[str]]):
+        self.total_results += 1
+        if style_type:
+            self.style_counts[style_type] += 1
+        if confidence is not None:
+            self.confidence_sum += confidence
+            self.confidence_count += 1
+        self.color_counts.update(colors or [])
+
+    def remove(self, style_type: Optional[str], confidence: Optional[float], colors: Optional[List[str]]):
+        """Убрать результат, который больше не показывается (например, заменен новой версией модели)"""
+        self.total_results -= 1
+        if style_type:
+            self.style_counts[style_type] -= 1
+        if confidence is not None:
+            self.confidence_sum -= confidence
+            self.confidence_count -= 1
+        self.color_counts.subtract(colors or [])
+
+    def is_empty(self) -> bool:
+        return not (self.total_results or self.confidence_count or self.confidence_sum
+                    or any(self.style_counts.values()) or any(self.color_counts.values()))
+
+    def add_analysis(self, analysis: dict):
+        self.add(analysis.get("style"), analysis.get("confidence"), analysis.get("colors"))
+
+
+async def _locked_summary(db: AsyncSession, user_id: int) -> StyleSummary:
+    # Строка создается один раз; дальше SELECT ... FOR UPDATE сериализует
+    # параллельные обновления профиля одного пользователя
+    await db.execute(
+        dialect_insert(db)(StyleSummary)
+        .values(user_id=user_id, total_results=0, confidence_sum=0.0, confidence_count=0,
+                style_counts={}, color_counts={})
+        .on_conflict_do_nothing(index_elements=["user_id"])
+    )
+    stmt = select(StyleSummary).where(StyleSummary.user_id == user_id).with_for_update()
+    return (await db.execute(stmt.execution_options(populate_existing=True))).scalar_one()
+
+
+def _merge_counts(current: Optional[dict], delta: Counter) -> dict:
+    merged = Counter(current or {})
+    merged.update(delta)
+    # Счетчики, обнулившиеся после удаления результатов, не храним
+    return {key: count for key, count in merged.items() if count > 0}
+
+
+async def apply_summary_delta(db: AsyncSession, user_id: int, delta: SummaryDelta):
+    """Применить приращение к профилю. Вызывается до commit транзакции, меняющей results"""
+    if delta.is_empty():
+        return
+    summary = await _locked_summary(db, user_id)
+    summary.total_results += delta.total_results
+    summary.confidence_sum += delta.confidence_sum
+    summary.confidence_count += delta.confidence_count
+    # JSON-колонки присваиваем заново: изменения на месте SQLAlchemy не отслеживает
+    summary.style_counts = _merge_counts(summary.style_counts, delta.style_counts)
+    summary.color_counts = _merge_counts(summary.color_counts, delta.color_counts)
+
+
+async def add_analyses_to_summary(db: AsyncSession, user_id: int, analyses: Iterable[dict]):
+    delta = SummaryDelta()
+    for analysis in analyses:
+        delta.add_analysis(analysis)
+    await apply_summary_delta(db, user_id, delta)
+
+
+async def replace_summary(db: AsyncSession, user_id: int, delta: SummaryDelta):
+    """Записать профиль целиком (пересборка)"""
+    values = {
+        "total_results": delta.total_results,
+        "confidence_sum": delta.confidence_sum,
+        "confidence_count": delta.confidence_count,
+        "style_counts": dict(delta.style_counts),
+        "color_counts": dict(delta.color_counts),
+    }
+    stmt = dialect_insert(db)(StyleSummary).values(user_id=user_id, **values)
+    await db.execute(stmt.on_conflict_do_update(index_elements=["user_id"], set_=values))
+
+
+def summary_response(user_id: int, summary: Optional[StyleSummary]) -> StyleSummaryResponse:
+    if summary is None or summary.total_results == 0:
+        return StyleSummaryResponse(user_id=user_id)
+
+    return StyleSummaryResponse(
+        user_id=user_id,
+        total_results=summary.total_results,
+        average_confidence=(
+            summary.confidence_sum / summary.confidence_count if summary.confidence_count else None
+        ),
+        styles=dict(sorted(summary.style_counts.items(), key=lambda item: item[1], reverse=True)),
+        top_colors=[
+            TopColor(color=color, count=count)
+            for color, count in Counter(summary.color_counts).most_common(TOP_COLORS)
+        ],
+    )
@@ -0,0 +1,53 @@
+"""Бенчмарк извлечения доминирующих цветов на разных разрешениях.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_colors --repeat 50
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.ml.colors import extract_dominant_colors
+
+RESOLUTIONS = {
+    "224x224 (model input)": (224, 224),
+    "VGA 640x480": (480, 640),
+    "Full HD 1920x1080": (1080, 1920),
+    "12 MP 4000x3000": (3000, 4000),
+}
+
+
+def make_image(height: int, width: int, seed: int = 0) -> np.ndarray:
+    """Синтетическое фото: несколько цветных блоков с шумом"""
+    rng = np.random.default_rng(seed)
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    colors = rng.integers(0, 256, size=(4, 3))
+    for i, color in enumerate(colors):
+        image[i * height // 4:(i + 1) * height // 4] = color
+    noise = rng.integers(-20, 20, size=(height, width, 1), dtype=np.int16)
+    return np.clip(image.astype(np.int16) + noise, 0, 255).astype(np.uint8)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'resolution':<24}{'mean, ms':>10}{'p95, ms':>10}  colors")
+    for label, (height, width) in RESOLUTIONS.items():
+        image = make_image(height, width)
+        extract_dominant_colors(image)  # прогрев
+
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            colors = extract_dominant_colors(image)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        timings = np.array(timings)
+        print(f"{label:<24}{timings.mean():>10.2f}{np.percentile(timings, 95):>10.2f}  {colors}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Бенчмарк получения входа модели: декодирование оригинала против хранилища тензоров.
+
+Сохраняет JPEG нескольких разрешений, кладет их предобработанные массивы
+в TensorStore во временной папке и сравнивает время load_image_array
+(декодирование + EXIF + resize) с чтением среза из memmap.
+Запуск из корня репозитория:
+    python -m benchmarks.bench_preprocess --images 200
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image as PILImage
+
+from app.ml.preprocess import INPUT_SHAPE, TensorStore, load_image_array
+
+RESOLUTIONS = {
+    "VGA 640x480": (640, 480),
+    "Full HD 1920x1080": (1920, 1080),
+    "12 MP 4000x3000": (4000, 3000),
+}
+
+
+def write_jpeg(path: str, size, seed: int):
+    rng = np.random.default_rng(seed)
+    # Плавный градиент с шумом сжимается как фото, а не как белый шум
+    base = np.linspace(0, 255, size[0], dtype=np.float32)[None, :, None]
+    pixels = base + rng.normal(scale=12, size=(size[1], size[0], 3))
+    PILImage.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(path, "JPEG", quality=90)
+
+
+def timed(fn, items) -> np.ndarray:
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        timings.append((time.perf_counter() - start) * 1000)
+    return np.array(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--images", type=int, default=50, help="изображений каждого разрешения")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        store = TensorStore(os.path.join(workdir, "tensors"), INPUT_SHAPE)
+        print(f"{'resolution':<20}{'decode, ms':>12}{'put, ms':>10}{'get, ms':>10}")
+        for label, size in RESOLUTIONS.items():
+            paths = []
+            for i in range(args.images):
+                path = os.path.join(workdir, f"{size[0]}_{i}.jpg")
+                write_jpeg(path, size, i)
+                paths.append(path)
+            keys = {path: hashlib.sha256(path.encode()).hexdigest() for path in paths}
+
+            arrays = {}
+            decode = timed(lambda path: arrays.__setitem__(path, load_image_array(path)), paths)
+            put = timed(lambda path: store.put(keys[path], arrays[path]), paths)
+            # Сумма по срезу - чтобы страницы memmap действительно прочитались
+            get = timed(lambda path: int(store.get(keys[path]).sum()), paths)
+            print(f"{label:<20}{decode.mean():>12.2f}{put.mean():>10.2f}{get.mean():>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Бенчмарк поиска похожих изображений: полный перебор против IVF.
+
+Пишет синтетические векторы в временный файл индекса, загружает его
+так же, как при старте приложения, и меряет задержку запроса и полноту
+(recall@k) IVF относительно точного перебора.
+Запуск из корня репозитория:
+    python -m benchmarks.bench_similarity --vectors 1000000 --queries 200
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from app.ml.embedding import EMBEDDING_DIM
+from app.ml.vector_index import VectorIndex, record_dtype
+
+WRITE_CHUNK = 100_000
+
+
+def write_vectors(path: str, count: int, users: int, seed: int = 0):
+    """Кластеризованные единичные векторы, как у реальных фото: есть группы похожих"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(256, EMBEDDING_DIM)).astype(np.float32)
+    dtype = record_dtype(EMBEDDING_DIM)
+    with open(path, "wb") as f:
+        for start in range(0, count, WRITE_CHUNK):
+            n = min(WRITE_CHUNK, count - start)
+            vectors = centers[rng.integers(len(centers), size=n)] + rng.normal(scale=0.5, size=(n, EMBEDDING_DIM))
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+            records = np.zeros(n, dtype=dtype)
+            records["result_id"] = np.arange(start + 1, start + n + 1)
+            records["user_id"] = rng.integers(1, users + 1, size=n)
+            records["vector"] = vectors
+            f.write(records.tobytes())
+
+
+def measure(search, queries) -> tuple:
+    timings, answers = [], []
+    for query in queries:
+        start = time.perf_counter()
+        answers.append({result_id for result_id, _ in search(query)})
+        timings.append((time.perf_counter() - start) * 1000)
+    timings = np.array(timings)
+    return timings, answers
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, default=16)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "vectors.bin")
+        write_vectors(path, args.vectors, args.users)
+
+        index = VectorIndex(path, EMBEDDING_DIM, ivf_threshold=0, nprobe=args.nprobe)
+        start = time.perf_counter()
+        index.refresh()
+        print(f"load {len(index):,} vectors: {time.perf_counter() - start:.2f} s")
+
+        rng = np.random.default_rng(1)
+        query_ids = rng.integers(1, args.vectors + 1, size=args.queries)
+        queries = [index.vector_for_result(int(result_id)) for result_id in query_ids]
+
+        brute, exact = measure(lambda q: index.search(q, args.k), queries)
+
+        start = time.perf_counter()
+        index.install(index.train())
+        print(f"train IVF: {time.perf_counter() - start:.2f} s")
+        ivf, approx = measure(lambda q: index.search(q, args.k), queries)
+        user, _ = measure(lambda q: index.search(q, args.k, user_id=1), queries)
+
+        recall = np.mean([len(a & e) / len(e) for a, e in zip(approx, exact)])
+        print(f"{'mode':<20}{'mean, ms':>10}{'p95, ms':>10}")
+        for label, timings in (("brute force", brute), (f"IVF nprobe={args.nprobe}", ivf), ("per user", user)):
+            print(f"{label:<20}{timings.mean():>10.2f}{np.percentile(timings, 95):>10.2f}")
+        print(f"IVF recall@{args.k}: {recall:.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+"""Проверка маршрутизации чтения на реплику на двух отдельных базах.
+
+Поднимает app.main:app в процессе с основной БД и "репликой", в которую
+ничего не реплицируется (как сильно отставшая реплика), и проверяет:
+  - после записи пользователь читает с основной БД, в том числе в другом
+    воркере (закрепление процесса сброшено, остается cookie);
+  - без закрепления и с поддельной cookie чтение идет с реплики;
+  - запрос, пользователь которого нашелся в кеше, не занимает соединение реплики;
+  - недоступная реплика заменяется основной БД без ошибок для клиента.
+По умолчанию базы - два файла SQLite во временной папке; можно указать две
+свои (таблицы в них пересоздаются, не указывайте рабочие базы).
+Запуск из корня репозитория (зависимости: pip install -r requirements-dev.txt):
+    python -m benchmarks.check_read_replica
+    python -m benchmarks.check_read_replica --primary postgresql+asyncpg://u:p@localhost:5432/a \\
+        --replica postgresql+asyncpg://u:p@localhost:5433/a
+
+Завершается с кодом 1, если какая-либо проверка не прошла.
+"""
+import argparse
+import asyncio
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Optional
+
+import numpy as np
+from PIL import Image as PILImage
+
+failures = []
+
+
+def check(name: str, ok: bool, detail=""):
+    print(f"{'PASS' if ok else 'FAIL'}  {name}{f' ({detail})' if detail else ''}")
+    if not ok:
+        failures.append(name)
+
+
+def jpeg() -> bytes:
+    pixels = np.random.default_rng(0).integers(0, 255, (64, 64, 3), dtype=np.uint8)
+    out = io.BytesIO()
+    PILImage.fromarray(pixels).save(out, "JPEG")
+    return out.getvalue()
+
+
+async def run(replica_dir: Optional[str]):
+    # Импорт после настройки окружения: движки создаются при импорте
+    import httpx
+    from prometheus_client import REGISTRY
+    from sqlalchemy import insert, select
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    from app.core import read_replica
+    from app.core.base import AsyncSessionLocal, Base, replica_engine
+    from app.main import app
+    from app.models import User
+
+    async def reset_schema(url: str):
+        engine = create_async_engine(url)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.run_sync(Base.metadata.create_all)
+        await engine.dispose()
+
+    await reset_schema(os.environ["DATABASE_URL"])
+    await reset_schema(os.environ["DATABASE_REPLICA_URL"])
+
+    def another_worker():
+        # Закрепление в памяти процесса другому воркеру не видно
+        read_replica._pinned.clear()
+
+    def replica_checkouts() -> float:
+        return REGISTRY.get_sample_value("db_pool_checkout_wait_seconds_count", {"engine": "replica"}) or 0.0
+
+    await app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://check") as client:
+            response = await client.post("/api/v1/auth/register", json={
+                "email": "replica@example.com", "username": "replica", "password": "password123",
+            })
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            # "Репликация" пользователя: результаты анализа на реплику не попадут
+            async with AsyncSessionLocal() as primary:
+                rows = [dict(row._mapping) for row in await primary.execute(select(User.__table__))]
+            async with replica_engine.begin() as conn:
+                await conn.execute(insert(User.__table__), rows)
+
+            response = await client.post(
+                "/api/v1/analysis/analyze-image", headers=headers,
+                files={"file": ("check.jpg", jpeg(), "image/jpeg")},
+            )
+            check("analyze-image", response.status_code == 200, response.status_code)
+            check("write sets pin cookie", read_replica.PIN_COOKIE in client.cookies)
+
+            response = await client.get("/api/v1/analysis/results", headers=headers)
+            check("same worker reads own write", len(response.json()) == 1, len(response.json()))
+
+            another_worker()
+            response = await client.get("/api/v1/analysis/results", headers=headers)
+            check("other worker reads own write via cookie", len(response.json()) == 1, len(response.json()))
+
+            pin = client.cookies[read_replica.PIN_COOKIE]
+            client.cookies.set(read_replica.PIN_COOKIE, pin[:-1] + ("0" if pin[-1] != "0" else "1"))
+            response = await client.get("/api/v1/analysis/results", headers=headers)
+            check("forged cookie is ignored (replica)", response.json() == [], len(response.json()))
+
+            client.cookies.clear()
+            response = await client.get("/api/v1/analysis/results", headers=headers)
+            check("unpinned read goes to replica", response.json() == [], len(response.json()))
+
+            # Пользователь уже в кеше принципалов: запись не должна занимать соединение реплики
+            before = replica_checkouts()
+            response = await client.post(
+                "/api/v1/analysis/analyze-image", headers=headers,
+                files={"file": ("check.jpg", jpeg(), "image/jpeg")},
+            )
+            check(
+                "cached principal does not check out a replica connection",
+                response.status_code == 200 and replica_checkouts() == before,
+                f"{replica_checkouts() - before} checkouts",
+            )
+
+            if not replica_dir:
+                print("SKIP  replica outage (only with the default SQLite replica)")
+                return
+            # Реплика пропадает: новые соединения к ней не открываются
+            client.cookies.clear()
+            another_worker()
+            await replica_engine.dispose()
+            shutil.rmtree(replica_dir)
+            response = await client.get("/api/v1/analysis/results", headers=headers)
+            check(
+                "unavailable replica falls back to primary",
+                response.status_code == 200 and len(response.json()) == 2,
+                f"status {response.status_code}",
+            )
+            check("replica skipped afterwards", read_replica._replica_down_until > time.monotonic())
+    finally:
+        await app.router.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check read replica routing on two databases")
+    parser.add_argument("--primary", help="URL основной БД (по умолчанию временный SQLite)")
+    parser.add_argument("--replica", help="URL реплики (по умолчанию временный SQLite)")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="replica-check-")
+    replica_dir = os.path.join(workdir, "replica")
+    os.makedirs(replica_dir)
+    os.environ.update({
+        "DATABASE_URL": args.primary or f"sqlite+aiosqlite:///{workdir}/primary.db",
+        "DATABASE_REPLICA_URL": args.replica or f"sqlite+aiosqlite:///{replica_dir}/replica.db",
+        "UPLOAD_DIR": os.path.join(workdir, "uploads"),
+        "DB_AUTO_CREATE": "false",
+        "RESPONSE_CACHE_TTL_SECONDS": "0",
+        "LOG_LEVEL": "WARNING",
+    })
+    try:
+        asyncio.run(run(None if args.replica else replica_dir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
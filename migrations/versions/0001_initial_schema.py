@@ -0,0 +1,86 @@
+"""initial schema (as created by create_all before migrations)
+
+Revision ID: 0001
+Revises: 
+Create Date: 2026-10-18 08:37:14.246599
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Ровно та схема, которую create_all создавал до перехода на миграции:
+    # такие базы не создаются заново, а помечаются этой ревизией (app.commands.migrate)
+    op.create_table('users',
+    sa.Column('username', sa.String(length=50), nullable=False),
+    sa.Column('email', sa.String(length=100), nullable=False),
+    sa.Column('password_hash', sa.String(length=255), nullable=False),
+    sa.Column('avatar_url', sa.String(length=255), nullable=True),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_users'))
+    )
+    op.create_index(op.f('ix_users_email'), 'users', ['email'], unique=True)
+    op.create_index(op.f('ix_users_id'), 'users', ['id'], unique=False)
+    op.create_index(op.f('ix_users_username'), 'users', ['username'], unique=True)
+
+    op.create_table('images',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('image_path', sa.String(length=255), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_images_user_id_users')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_images'))
+    )
+    op.create_index(op.f('ix_images_id'), 'images', ['id'], unique=False)
+
+    op.create_table('sessions',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('token', sa.String(length=255), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_sessions_user_id_users')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_sessions'))
+    )
+    op.create_index(op.f('ix_sessions_id'), 'sessions', ['id'], unique=False)
+    op.create_index(op.f('ix_sessions_token'), 'sessions', ['token'], unique=False)
+
+    op.create_table('results',
+    sa.Column('image_id', sa.Integer(), nullable=False),
+    sa.Column('style_type', sa.String(length=100), nullable=True),
+    sa.Column('confidence_score', sa.Float(), nullable=True),
+    sa.Column('dominant_colors', sa.String(length=255), nullable=True),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['image_id'], ['images.id'], name=op.f('fk_results_image_id_images')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_results'))
+    )
+    op.create_index(op.f('ix_results_id'), 'results', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_results_id'), table_name='results')
+    op.drop_table('results')
+    op.drop_index(op.f('ix_sessions_token'), table_name='sessions')
+    op.drop_index(op.f('ix_sessions_id'), table_name='sessions')
+    op.drop_table('sessions')
+    op.drop_index(op.f('ix_images_id'), table_name='images')
+    op.drop_table('images')
+    op.drop_index(op.f('ix_users_username'), table_name='users')
+    op.drop_index(op.f('ix_users_id'), table_name='users')
+    op.drop_index(op.f('ix_users_email'), table_name='users')
+    op.drop_table('users')
@@ -0,0 +1,89 @@
+"""schema changes made before migrations: upload metadata, result owner and model data, analysis jobs
+
+Revision ID: 0001b
+Revises: 0001
+Create Date: 2026-10-18 09:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0001b'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Базы, которые create_all вели до миграций, могли получить новые таблицы
+    # (create_all создает недостающие), но не новые колонки - проверяем по факту
+    inspector = sa.inspect(op.get_bind())
+    tables = set(inspector.get_table_names())
+
+    op.create_index('ix_users_created_at_id', 'users', ['created_at', 'id'], unique=False)
+
+    op.add_column('images', sa.Column('filename', sa.String(length=255), nullable=True))
+    op.add_column('images', sa.Column('content_type', sa.String(length=100), nullable=True))
+    op.add_column('images', sa.Column('file_size', sa.Integer(), nullable=True))
+    op.add_column('images', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_images_content_hash'), 'images', ['content_hash'], unique=False)
+
+    op.add_column('results', sa.Column('user_id', sa.Integer(), nullable=True))
+    op.add_column('results', sa.Column('analysis_data', sa.JSON(), nullable=True))
+    op.add_column('results', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('results', sa.Column('model_version', sa.String(length=50), nullable=True))
+    # Владелец результата - владелец изображения
+    op.execute("UPDATE results SET user_id = (SELECT images.user_id FROM images WHERE images.id = results.image_id)")
+    with op.batch_alter_table('results') as batch_op:
+        batch_op.alter_column('user_id', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_foreign_key(op.f('fk_results_user_id_users'), 'users', ['user_id'], ['id'])
+    op.create_index('ix_results_content_hash_model_version', 'results', ['content_hash', 'model_version'], unique=False)
+    op.create_index('ix_results_user_id_created_at_id', 'results', ['user_id', sa.text('created_at DESC'), 'id'], unique=False)
+
+    if 'analysis_jobs' not in tables:
+        op.create_table('analysis_jobs',
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('image_id', sa.Integer(), nullable=False),
+        sa.Column('result_id', sa.Integer(), nullable=True),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('attempts', sa.Integer(), nullable=False),
+        sa.Column('error', sa.String(length=255), nullable=True),
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['image_id'], ['images.id'], name=op.f('fk_analysis_jobs_image_id_images')),
+        sa.ForeignKeyConstraint(['result_id'], ['results.id'], name=op.f('fk_analysis_jobs_result_id_results')),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_analysis_jobs_user_id_users')),
+        sa.PrimaryKeyConstraint('id', name=op.f('pk_analysis_jobs'))
+        )
+        op.create_index(op.f('ix_analysis_jobs_id'), 'analysis_jobs', ['id'], unique=False)
+        op.create_index('ix_analysis_jobs_status_id', 'analysis_jobs', ['status', 'id'], unique=False)
+        op.create_index(op.f('ix_analysis_jobs_user_id'), 'analysis_jobs', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_analysis_jobs_user_id'), table_name='analysis_jobs')
+    op.drop_index('ix_analysis_jobs_status_id', table_name='analysis_jobs')
+    op.drop_index(op.f('ix_analysis_jobs_id'), table_name='analysis_jobs')
+    op.drop_table('analysis_jobs')
+
+    op.drop_index('ix_results_user_id_created_at_id', table_name='results')
+    op.drop_index('ix_results_content_hash_model_version', table_name='results')
+    with op.batch_alter_table('results') as batch_op:
+        batch_op.drop_constraint(op.f('fk_results_user_id_users'), type_='foreignkey')
+        batch_op.drop_column('model_version')
+        batch_op.drop_column('content_hash')
+        batch_op.drop_column('analysis_data')
+        batch_op.drop_column('user_id')
+
+    op.drop_index(op.f('ix_images_content_hash'), table_name='images')
+    with op.batch_alter_table('images') as batch_op:
+        batch_op.drop_column('content_hash')
+        batch_op.drop_column('file_size')
+        batch_op.drop_column('content_type')
+        batch_op.drop_column('filename')
+
+    op.drop_index('ix_users_created_at_id', table_name='users')
@@ -0,0 +1,32 @@
+"""refresh sessions: unique token hash, expires_at and user_id indexes
+
+Revision ID: 0002
+Revises: 0001b
+Create Date: 2026-10-18 09:05:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001b'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Старые строки хранили токены в открытом виде и нигде не использовались
+    op.execute("DELETE FROM sessions")
+    op.drop_index(op.f('ix_sessions_token'), table_name='sessions')
+    op.create_index(op.f('ix_sessions_token'), 'sessions', ['token'], unique=True)
+    op.create_index(op.f('ix_sessions_expires_at'), 'sessions', ['expires_at'], unique=False)
+    op.create_index(op.f('ix_sessions_user_id'), 'sessions', ['user_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_sessions_user_id'), table_name='sessions')
+    op.drop_index(op.f('ix_sessions_expires_at'), table_name='sessions')
+    op.drop_index(op.f('ix_sessions_token'), table_name='sessions')
+    op.create_index('ix_sessions_token', 'sessions', ['token'], unique=False)
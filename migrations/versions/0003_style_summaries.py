@@ -0,0 +1,41 @@
+"""style summaries
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 08:46:54.456945
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('style_summaries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('total_results', sa.Integer(), nullable=False),
+    sa.Column('confidence_sum', sa.Float(), nullable=False),
+    sa.Column('confidence_count', sa.Integer(), nullable=False),
+    sa.Column('style_counts', sa.JSON(), nullable=False),
+    sa.Column('color_counts', sa.JSON(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.id'], name=op.f('fk_style_summaries_user_id_users')),
+    sa.PrimaryKeyConstraint('id', name=op.f('pk_style_summaries'))
+    )
+    op.create_index(op.f('ix_style_summaries_id'), 'style_summaries', ['id'], unique=False)
+    op.create_index(op.f('ix_style_summaries_user_id'), 'style_summaries', ['user_id'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_style_summaries_user_id'), table_name='style_summaries')
+    op.drop_index(op.f('ix_style_summaries_id'), table_name='style_summaries')
+    op.drop_table('style_summaries')
@@ -0,0 +1,41 @@
+"""results: one row per image and model version
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:20:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Повторы (image_id, model_version) оставлять нельзя: задачи анализа
+    # переводим на первый результат, остальные удаляем
+    op.execute("""
+        UPDATE analysis_jobs SET result_id = (
+            SELECT MIN(same.id) FROM results r
+            JOIN results same ON same.image_id = r.image_id AND same.model_version = r.model_version
+            WHERE r.id = analysis_jobs.result_id
+        )
+        WHERE result_id IN (SELECT id FROM results WHERE model_version IS NOT NULL)
+    """)
+    op.execute("""
+        DELETE FROM results
+        WHERE model_version IS NOT NULL
+          AND id NOT IN (
+            SELECT MIN(id) FROM results WHERE model_version IS NOT NULL GROUP BY image_id, model_version
+          )
+    """)
+    op.create_index('ix_results_image_id_model_version', 'results', ['image_id', 'model_version'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_results_image_id_model_version', table_name='results')